@@ -9,8 +9,6 @@ from components.hatch import Hatch
 from components.vision import Vision
 from pyswervedrive.chassis import SwerveChassis
 
-from utilities.functions import rotate_vector
-
 
 class Aligner(StateMachine):
     """
@@ -43,7 +41,7 @@ class Aligner(StateMachine):
 
     @state(first=True)
     def wait_for_vision(self):
-        if self.vision.fiducial_in_sight:
+        if self.vision.target_tracked:
             self.next_state("target_tape_align")
 
     @state(must_finish=True)
@@ -53,6 +51,8 @@ class Aligner(StateMachine):
 
         The robot will try to correct errors until they are within tolerance
         by strafing and moving in a hyberbolic curve towards the target.
+        It steers on the vision system's tracked target, which rides through
+        short dropouts in the camera frames.
         """
         if initial_call:
             self.successful = False
@@ -60,7 +60,17 @@ class Aligner(StateMachine):
             self.chassis.automation_running = True
             self.counter = 0
 
-        if not self.vision.fiducial_in_sight:
+        if self.vision.fiducial_in_sight:
+            self.last_vision = state_tm
+
+        tracked = self.vision.target_tracked
+        if tracked:
+            fiducial_x, fiducial_y = self.vision.get_target_position()
+            # Once the camera has lost the target and we have driven past
+            # where it should be, finish the approach blind
+            tracked = self.vision.fiducial_in_sight or fiducial_x * self.direction > 0
+
+        if not tracked:
             # self.chassis.set_inputs(0, 0, 0)
             # self.next_state("success")
             self.chassis.set_inputs(
@@ -73,10 +83,13 @@ class Aligner(StateMachine):
             if self.counter < 1:
                 self.logger.info("Seen vision")
                 self.counter += 1
-            self.last_vision = state_tm
-            fiducial_x, fiducial_y, delta_heading = self.vision.get_fiducial_position()
             fiducial_x /= self.lookahead_factor
             norm = math.hypot(fiducial_x, fiducial_y)
+            if norm < 1e-6:
+                # We are on top of the target, so there is no direction to steer in
+                self.chassis.set_inputs(0, 0, 0)
+                self.next_state("success")
+                return
             vx = fiducial_x / norm * self.alignment_speed
             vy = fiducial_y / norm * self.alignment_speed
             if fiducial_x > 0:
@@ -88,7 +101,6 @@ class Aligner(StateMachine):
                 # vx = -self.alignment_speed * (1 - abs(fiducial_y/1.5))
                 self.direction = -1
             # vy = max(min(fiducial_y * self.alignment_kp_y, 1), -1)
-            vx, vy = rotate_vector(vx, vy, -delta_heading)
             self.chassis.set_inputs(vx, vy, 0, field_oriented=False)
 
     @state(must_finish=True)
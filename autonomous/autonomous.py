@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import math
+import os
 
 from magicbot.state_machine import AutonomousStateMachine, state
 import wpilib
@@ -9,7 +10,18 @@ from components.hatch import Hatch
 from components.vision import Vision
 from pyswervedrive.chassis import SwerveChassis
 from utilities.navx import NavX
-from utilities.pure_pursuit import PurePursuit, Waypoint, insert_trapezoidal_waypoints
+from utilities.path_file import load_leg, write_legs
+from utilities.pure_pursuit import (
+    PathCache,
+    PurePursuit,
+    Waypoint,
+    generate_velocity_profile,
+)
+
+#: Where trajectories generated ahead of time are deployed, see generate_paths
+PATH_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "paths"
+)
 
 
 @dataclass
@@ -58,6 +70,12 @@ class AutoBase(AutonomousStateMachine):
     # This one is just a typehint
     pursuit: PurePursuit
 
+    # Shared between all the autonomous modes
+    path_cache = PathCache(maxsize=32)
+
+    acceleration = 2
+    deceleration = -1
+
     def __init__(self):
         super().__init__()
         self.coordinates: Coordinates = left_coordinates
@@ -67,46 +85,60 @@ class AutoBase(AutonomousStateMachine):
         self.desired_angle_navx = 0
         self.minimum_path_completion = 0.85
 
-        self.acceleration = 2
-        self.deceleration = -0.25
-
-        self.pursuit = PurePursuit(look_ahead=0.2, look_ahead_speed_modifier=0.25)
+        self.pursuit = PurePursuit(
+            look_ahead=0.2, look_ahead_speed_modifier=0.25, projection=True
+        )
 
     def setup(self):
         self.hatch.has_hatch = True
         self.hatch_intake.alignment_speed = 0.75
         self.hatch_deposit.alignment_speed = 0.75
 
+        # Load or compile all the fixed legs now, rather than on the first tick of each
+        for coordinates in (left_coordinates, right_coordinates):
+            for leg in self.fixed_legs(coordinates):
+                trajectory = load_leg(
+                    PATH_DIRECTORY, leg, self.acceleration, self.deceleration
+                )
+                if trajectory is not None:
+                    self.path_cache.put(
+                        trajectory, leg, self.acceleration, self.deceleration
+                    )
+                else:
+                    self.path_cache.get(leg, self.acceleration, self.deceleration)
+
+    @staticmethod
+    def fixed_legs(coordinates: Coordinates):
+        """The legs driven after leaving the current position."""
+        return (
+            (coordinates.front_cargo_bay,),
+            (coordinates.side_cargo_bay_alignment_point, coordinates.side_cargo_bay),
+            (coordinates.setup_loading_bay, coordinates.loading_bay),
+        )
+
     def on_enable(self):
         super().on_enable()
-        self.chassis.odometry_x = self.coordinates.start_pos.x
-        self.chassis.odometry_y = self.coordinates.start_pos.y
+        self.chassis.reset_odometry(
+            self.coordinates.start_pos.x, self.coordinates.start_pos.y
+        )
         self.completed_runs = 0
 
     @state(first=True)
     def drive_to_cargo_bay(self, initial_call):
         if initial_call:
             if self.completed_runs == 0:
-                waypoints = insert_trapezoidal_waypoints(
-                    (self.current_pos, self.coordinates.front_cargo_bay),
-                    self.acceleration,
-                    self.deceleration,
-                )
+                self.start_path((self.coordinates.front_cargo_bay,))
             elif self.completed_runs == 1:
-                waypoints = insert_trapezoidal_waypoints(
+                self.start_path(
                     (
-                        self.current_pos,
                         self.coordinates.side_cargo_bay_alignment_point,
                         self.coordinates.side_cargo_bay,
-                    ),
-                    self.acceleration,
-                    self.deceleration,
+                    )
                 )
             else:
                 self.next_state("drive_to_loading_bay")
                 self.completed_runs += 1
                 return
-            self.pursuit.build_path(waypoints)
         self.follow_path()
         if (
             self.vision.fiducial_in_sight and self.ready_for_vision()
@@ -124,36 +156,19 @@ class AutoBase(AutonomousStateMachine):
     @state
     def drive_to_loading_bay(self, initial_call):
         if initial_call:
+            leg = (self.coordinates.setup_loading_bay, self.coordinates.loading_bay)
             if self.completed_runs == 1:
-                waypoints = insert_trapezoidal_waypoints(
-                    (
-                        self.current_pos,
-                        Waypoint(
-                            self.current_pos.x - 1,
-                            self.current_pos.y,
-                            self.imu.getAngle(),
-                            1.5,
-                        ),
-                        self.coordinates.setup_loading_bay,
-                        self.coordinates.loading_bay,
-                    ),
-                    self.acceleration,
-                    self.deceleration,
+                # Back away from the cargo bay first
+                backup = Waypoint(
+                    self.current_pos.x - 1, self.current_pos.y, self.imu.getAngle(), 1.5
                 )
+                self.pursuit.build_path((self.current_pos, backup))
+                self.queue_path(leg)
             elif self.completed_runs == 2:
-                waypoints = insert_trapezoidal_waypoints(
-                    (
-                        self.current_pos,
-                        self.coordinates.setup_loading_bay,
-                        self.coordinates.loading_bay,
-                    ),
-                    self.acceleration,
-                    self.deceleration,
-                )
+                self.start_path(leg)
             else:
                 self.next_state("stop")
                 return
-            self.pursuit.build_path(waypoints)
         self.follow_path()
         if (
             self.vision.fiducial_in_sight and self.ready_for_vision()
@@ -174,19 +189,35 @@ class AutoBase(AutonomousStateMachine):
 
     @property
     def current_pos(self):
-        return Waypoint(
-            self.chassis.odometry_x, self.chassis.odometry_y, self.imu.getAngle(), 3
+        return Waypoint(*self.chassis.position, self.imu.getAngle(), 3)
+
+    def start_path(self, leg):
+        """Follow a cached leg, starting from the current position.
+
+        Args:
+            leg: the fixed waypoints to drive through, see fixed_legs.
+        """
+        trajectory = self.path_cache.stitch(
+            (self.current_pos,), leg, self.acceleration, self.deceleration
         )
+        self.pursuit.follow(trajectory)
+
+    def queue_path(self, leg):
+        """Follow a cached leg on from the current path, without stopping."""
+        trajectory = self.path_cache.get(leg, self.acceleration, self.deceleration)
+        self.pursuit.queue_path(trajectory, self.acceleration, self.deceleration)
 
     def follow_path(self):
         vx, vy, heading = self.pursuit.find_velocity(self.chassis.position)
         if self.pursuit.completed_path:
             self.chassis.set_inputs(0, 0, 0, field_oriented=True)
             return
-        self.chassis.set_velocity_heading(vx, vy, heading)
+        self.chassis.set_velocity_heading(
+            vx, vy, heading, heading_rate=self.pursuit.heading_rate
+        )
 
     def ready_for_vision(self):
-        if self.pursuit.waypoints[-1][4] - self.pursuit.distance_traveled < 2:
+        if self.pursuit.distance_remaining < 2:
             return True
         else:
             return False
@@ -230,16 +261,12 @@ class SideOnlyBase(AutoBase):
     @state(first=True)
     def drive_to_cargo_bay(self, initial_call):
         if initial_call:
-            waypoints = insert_trapezoidal_waypoints(
+            self.start_path(
                 (
-                    self.current_pos,
                     self.coordinates.side_cargo_bay_alignment_point,
                     self.coordinates.side_cargo_bay,
-                ),
-                self.acceleration,
-                self.deceleration,
+                )
             )
-            self.pursuit.build_path(waypoints)
         self.follow_path()
         if (
             self.vision.fiducial_in_sight and self.ready_for_vision()
@@ -276,15 +303,16 @@ class DriveForwards(AutonomousStateMachine):
 
     def __init__(self):
         super().__init__()
-        self.pursuit = PurePursuit(look_ahead=0.2, look_ahead_speed_modifier=0.25)
+        self.pursuit = PurePursuit(
+            look_ahead=0.2, look_ahead_speed_modifier=0.25, projection=True
+        )
 
         self.acceleration = 1
         self.deceleration = -0.5
 
     def on_enable(self):
         super().on_enable()
-        self.chassis.odometry_x = 0
-        self.chassis.odometry_y = 0
+        self.chassis.reset_odometry(0, 0)
 
     @state(first=True)
     def wait_for_input(self):
@@ -294,12 +322,13 @@ class DriveForwards(AutonomousStateMachine):
     @state
     def drive_forwards(self, initial_call):
         if initial_call:
-            waypoints = insert_trapezoidal_waypoints(
-                (self.current_pos, Waypoint(1.5, 0, 0, 0)),
+            waypoints = (self.current_pos, Waypoint(1.5, 0, 0, 0))
+            profile = generate_velocity_profile(
+                waypoints,
                 acceleration=self.acceleration,
                 deceleration=self.deceleration,
             )
-            self.pursuit.build_path(waypoints)
+            self.pursuit.build_path(waypoints, profile)
         self.follow_path()
         if self.pursuit.completed_path:
             self.chassis.set_inputs(0, 0, 0)
@@ -307,43 +336,41 @@ class DriveForwards(AutonomousStateMachine):
 
     @property
     def current_pos(self):
-        return Waypoint(
-            self.chassis.odometry_x, self.chassis.odometry_y, self.imu.getAngle(), 2
-        )
+        return Waypoint(*self.chassis.position, self.imu.getAngle(), 2)
 
     def follow_path(self):
         vx, vy, heading = self.pursuit.find_velocity(self.chassis.position)
         if self.pursuit.completed_path:
             self.chassis.set_inputs(0, 0, 0, field_oriented=True)
             return
-        self.chassis.set_velocity_heading(vx, vy, heading)
+        self.chassis.set_velocity_heading(
+            vx, vy, heading, heading_rate=self.pursuit.heading_rate
+        )
 
 
 class DoubleFrontBase(AutoBase):
+    @staticmethod
+    def fixed_legs(coordinates: Coordinates):
+        return AutoBase.fixed_legs(coordinates) + (
+            (coordinates.setup_loading_bay, coordinates.front_cargo_bay.reflect()),
+        )
+
     @state(first=True)
     def drive_to_cargo_bay(self, initial_call):
         if initial_call:
             if self.completed_runs == 0:
-                waypoints = insert_trapezoidal_waypoints(
-                    (self.current_pos, self.coordinates.front_cargo_bay),
-                    self.acceleration,
-                    self.deceleration,
-                )
+                self.start_path((self.coordinates.front_cargo_bay,))
             elif self.completed_runs == 1:
-                waypoints = insert_trapezoidal_waypoints(
+                self.start_path(
                     (
-                        self.current_pos,
                         self.coordinates.setup_loading_bay,
                         self.coordinates.front_cargo_bay.reflect(),
-                    ),
-                    self.acceleration,
-                    self.deceleration,
+                    )
                 )
             else:
                 self.next_state("drive_to_loading_bay")
                 self.completed_runs += 1
                 return
-            self.pursuit.build_path(waypoints)
         self.follow_path()
         if (
             self.vision.fiducial_in_sight and self.ready_for_vision()
@@ -366,3 +393,17 @@ class RightDoubleFront(DoubleFrontBase):
     def __init__(self):
         super().__init__()
         self.coordinates = right_coordinates
+
+
+def generate_paths(directory: str = PATH_DIRECTORY) -> None:
+    """Write out the fixed legs of every autonomous mode ahead of time."""
+    legs = {
+        leg
+        for coordinates in (left_coordinates, right_coordinates)
+        for leg in DoubleFrontBase.fixed_legs(coordinates)
+    }
+    write_legs(directory, legs, AutoBase.acceleration, AutoBase.deceleration)
+
+
+if __name__ == "__main__":
+    generate_paths()
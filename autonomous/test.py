@@ -15,8 +15,7 @@ class TestPursuitAuto(AutonomousStateMachine):
 
     def on_enable(self):
         super().on_enable()
-        self.chassis.odometry_x = 0
-        self.chassis.odometry_y = 0
+        self.chassis.reset_odometry(0, 0)
         self.points = (
             self.current_pos,
             Waypoint(2, 0, 0, 1),
@@ -37,6 +36,4 @@ class TestPursuitAuto(AutonomousStateMachine):
 
     @property
     def current_pos(self):
-        return Waypoint(
-            self.chassis.odometry_x, self.chassis.odometry_y, self.imu.getAngle(), 1
-        )
+        return Waypoint(*self.chassis.position, self.imu.getAngle(), 1)
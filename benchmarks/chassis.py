@@ -0,0 +1,103 @@
+"""Micro-benchmark of the per-tick SwerveChassis odometry update.
+
+Run from the repository root with:
+
+    python -m benchmarks.chassis
+
+The modules and IMU are replaced with objects that return fixed readings, so
+only the chassis' own computation is timed. LegacySwerveChassis goes back to
+the least squares solve update_odometry used to do every tick, with the rest
+of the update unchanged, for comparison.
+"""
+
+import math
+import timeit
+
+import numpy as np
+
+from pyswervedrive.chassis import SwerveChassis
+
+LOOP_PERIOD = 1 / 50
+
+
+class BenchModule:
+    """A swerve module with constant sensor readings."""
+
+    max_drive_speed = 4.0
+
+    def __init__(self, x_pos, y_pos):
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        self.dist = math.hypot(x_pos, y_pos)
+        self.angle = math.atan2(y_pos, x_pos)
+        self.measured_azimuth = 0.4
+        self.wheel_pos = 0.0
+        self.wheel_vel = 1.1
+        self.aligned = True
+
+    def update_odometry(self):
+        pass
+
+    def get_cartesian_delta(self):
+        return 0.02, 0.01
+
+    def get_cartesian_vel(self):
+        return 1.0, 0.5
+
+    def reset_encoder_delta(self):
+        pass
+
+    def set_drive_brake(self):
+        pass
+
+
+class BenchIMU:
+    def getAngle(self):
+        return 0.3
+
+    def getHeadingRate(self):
+        return 0.0
+
+
+def make_chassis(chassis_class=SwerveChassis):
+    chassis = chassis_class()
+    chassis.imu = BenchIMU()
+    chassis.module_a = BenchModule(0.3, 0.3)
+    chassis.module_b = BenchModule(-0.3, 0.3)
+    chassis.module_c = BenchModule(-0.3, -0.3)
+    chassis.module_d = BenchModule(0.3, -0.3)
+    chassis.setup()
+    chassis.on_enable()
+    return chassis
+
+
+class LegacySwerveChassis(SwerveChassis):
+    """Solves for the chassis velocity by least squares every tick."""
+
+    def robot_movement_from_odometry(self, odometry_outputs, angle, z_vel=0):
+        A = self.kinematics.inverse_matrix
+        lstsq_ret = np.linalg.lstsq(A, odometry_outputs, rcond=None)
+        x, y, theta = lstsq_ret[0].reshape(3)
+        x_field, y_field = self.field_orient(x, y, angle + z_vel * (1 / 200))
+        return x_field, y_field, theta
+
+
+def time_per_call(func, number=20000, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    results = (
+        ("update_odometry (lstsq)", make_chassis(LegacySwerveChassis).update_odometry),
+        ("update_odometry (pinv)", make_chassis().update_odometry),
+    )
+    for name, func in results:
+        t = time_per_call(func)
+        print(
+            f"{name:>30}: {t * 1e6:7.2f} us/call, "
+            f"{t / LOOP_PERIOD:.3%} of the {LOOP_PERIOD * 1000:.0f} ms loop"
+        )
+
+
+if __name__ == "__main__":
+    main()
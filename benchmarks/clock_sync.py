@@ -0,0 +1,104 @@
+"""Accuracy and cost of estimating the coprocessor's clock offset.
+
+Run from the repository root with:
+
+    python -m benchmarks.clock_sync
+
+A simulated coprocessor answers a ping every control loop with random, and
+occasionally large, delays. The offset Vision used to take from the latest
+pong alone is compared to ClockSync, with pongs both timestamped as they
+arrive and only seen at the next control loop.
+"""
+
+import math
+import timeit
+
+import numpy as np
+
+from utilities.clock_sync import ClockSync, SimulatedCoprocessor
+
+LOOP_PERIOD = 1 / 50
+DURATION = 60  # seconds
+WARMUP = 5  # seconds
+
+
+def legacy_offset(sent, remote, received):
+    return sent - remote
+
+
+def simulate(coprocessor, estimate):
+    """Run the exchange every loop.
+
+    Returns:
+        The errors in the estimated time of a remote event, once the
+        estimator has warmed up.
+    """
+    errors = []
+    start = 1000.0
+    for i in range(int(DURATION / LOOP_PERIOD)):
+        sent = start + i * LOOP_PERIOD
+        remote, received = coprocessor.exchange(sent)
+        offset = estimate(sent, remote, received)
+        if i * LOOP_PERIOD >= WARMUP:
+            errors.append(offset - coprocessor.true_offset(received))
+    return np.array(errors)
+
+
+def clock_sync_estimate():
+    clock = ClockSync()
+
+    def estimate(sent, remote, received):
+        clock.add_sample(sent, remote, received)
+        return clock.offset(received)
+
+    return estimate
+
+
+def main():
+    scenarios = (
+        ("steady", dict(jitter=0.001, spike_probability=0.01)),
+        ("jittery", dict(jitter=0.005, spike_probability=0.1)),
+        ("drifting", dict(drift=1e-4, jitter=0.002, spike_probability=0.05)),
+    )
+    print(f"{'':>32}  {'rms error':>10}  {'max error':>10}")
+    for scenario, params in scenarios:
+        for name, loop_period, make_estimate in (
+            ("latest pong", LOOP_PERIOD, lambda: legacy_offset),
+            ("ClockSync, polled", LOOP_PERIOD, clock_sync_estimate),
+            ("ClockSync, timestamped", 0, clock_sync_estimate),
+        ):
+            coprocessor = SimulatedCoprocessor(
+                offset=123.4, loop_period=loop_period, seed=4774, **params
+            )
+            errors = simulate(coprocessor, make_estimate())
+            rms = math.sqrt(np.mean(errors ** 2))
+            print(
+                f"{scenario + ': ' + name:>32}  {rms * 1000:7.2f} ms"
+                f"  {abs(errors).max() * 1000:7.2f} ms"
+            )
+
+    # Time the estimator with a full window
+    estimate = clock_sync_estimate()
+    coprocessor = SimulatedCoprocessor(offset=123.4, loop_period=0, seed=1)
+    sent = 1000.0
+    for i in range(512):
+        sent += LOOP_PERIOD
+        remote, received = coprocessor.exchange(sent)
+        estimate(sent, remote, received)
+    number = 20000
+    t = (
+        min(
+            timeit.repeat(
+                lambda: estimate(sent, remote, received), number=number, repeat=5
+            )
+        )
+        / number
+    )
+    print(
+        f"ClockSync update: {t * 1e6:.2f} us/call, "
+        f"{t / LOOP_PERIOD:.3%} of the {LOOP_PERIOD * 1000:.0f} ms loop"
+    )
+
+
+if __name__ == "__main__":
+    main()
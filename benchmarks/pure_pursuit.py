@@ -0,0 +1,117 @@
+"""Micro-benchmark of the per-tick PurePursuit computation.
+
+Run from the repository root with:
+
+    python -m benchmarks.pure_pursuit
+
+The legacy functions reproduce the NumPy 2-vector implementation that
+find_intersections and compute_direction used to have, for comparison.
+LegacyPurePursuit plugs them back into find_velocity to give a baseline for
+the whole per-tick step.
+"""
+
+import math
+import timeit
+
+import numpy as np
+
+from utilities.pure_pursuit import PurePursuit, Waypoint
+
+LOOP_PERIOD = 1 / 50
+
+
+def legacy_intersection(start, end, robot_position, r):
+    x1, y1 = start
+    x2, y2 = end
+    robot_x, robot_y = robot_position
+    x2 -= robot_x
+    x1 -= robot_x
+    y2 -= robot_y
+    y1 -= robot_y
+    segment_end = np.array((x2, y2))
+
+    dx = x2 - x1
+    dy = y2 - y1
+    dr = math.hypot(dx, dy)
+    D = x1 * y2 - x2 * y1
+    delta = r ** 2 * dr ** 2 - D ** 2
+    if delta < 0:
+        return None
+    sqrt_delta = math.sqrt(delta)
+    right_x = (-1 if dy < 0 else 1) * dx * sqrt_delta
+    left_x = D * dy
+    right_y = abs(dy) * sqrt_delta
+    left_y = -D * dx
+    denominator = dr ** 2
+    intersection_1 = np.array((left_x + right_x, left_y + right_y))
+    intersection_1 /= denominator
+    intersection_2 = np.array((left_x - right_x, left_y - right_y))
+    intersection_2 /= denominator
+    if np.linalg.norm(intersection_1 - segment_end) < np.linalg.norm(
+        intersection_2 - segment_end
+    ):
+        return intersection_1
+    return intersection_2
+
+
+def legacy_direction(start, end, robot_position, r):
+    goal_point = legacy_intersection(start, end, robot_position, r)
+    goal_point /= np.linalg.norm(goal_point)
+    return goal_point
+
+
+class LegacyPurePursuit(PurePursuit):
+    def compute_direction(self, robot_position, segment, distance_along_path):
+        start = self.waypoints.item(segment)[:2]
+        end = self.waypoints.item(segment + 1)[:2]
+        goal_point = legacy_intersection(
+            start, end, robot_position, self.speed_look_ahead
+        )
+        if goal_point is None:
+            robot_x, robot_y = robot_position
+            goal_point = np.array((end[0] - robot_x, end[1] - robot_y))
+        goal_point /= np.linalg.norm(goal_point)
+        return goal_point
+
+
+def time_per_call(func, number=20000, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    waypoints = [Waypoint(i * 0.05, (i % 7) * 0.01, 0, 2) for i in range(2000)]
+    pursuit = PurePursuit(look_ahead=0.2, look_ahead_speed_modifier=0.25)
+    pursuit.build_path(waypoints)
+    legacy_pursuit = LegacyPurePursuit(look_ahead=0.2, look_ahead_speed_modifier=0.25)
+    legacy_pursuit.build_path(waypoints)
+    segment = 500
+    robot_position = (25.0, 0.1)
+    start = waypoints[segment][:2]
+    end = waypoints[segment + 1][:2]
+
+    def find_velocity(pursuit):
+        pursuit.current_waypoint_number = segment
+        pursuit.find_velocity(robot_position)
+
+    results = (
+        (
+            "legacy direction (numpy)",
+            lambda: legacy_direction(start, end, robot_position, 0.2),
+        ),
+        (
+            "compute_direction (scalar)",
+            lambda: pursuit.compute_direction(robot_position, segment, 0),
+        ),
+        ("legacy find_velocity", lambda: find_velocity(legacy_pursuit)),
+        ("find_velocity", lambda: find_velocity(pursuit)),
+    )
+    for name, func in results:
+        t = time_per_call(func)
+        print(
+            f"{name:>28}: {t * 1e6:7.2f} us/call, "
+            f"{t / LOOP_PERIOD:.3%} of the {LOOP_PERIOD * 1000:.0f} ms loop"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import wpilib
 import wpilib_controller
 
 from components.vision import Vision
+from utilities import motor_config
 
 
 class Height(enum.Enum):
@@ -35,10 +36,12 @@ class CargoManipulator:
         self.intake_motor_output = 0.0
 
     def setup(self) -> None:
-        self.arm_motor.setIdleMode(rev.IdleMode.kBrake)
-        self.arm_motor.setInverted(False)
+        with motor_config.timed("cargo arm"):
+            self.arm_motor.setIdleMode(rev.IdleMode.kBrake)
+            self.arm_motor.setInverted(False)
 
-        self.intake_motor.setNeutralMode(ctre.NeutralMode.Brake)
+        with motor_config.timed("cargo intake"):
+            self.intake_motor.setNeutralMode(ctre.NeutralMode.Brake)
 
         self.encoder = self.arm_motor.getEncoder()
         self.pid_controller = wpilib_controller.PIDController(
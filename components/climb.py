@@ -6,6 +6,7 @@ import rev
 import wpilib
 import wpilib_controller
 
+from utilities import motor_config
 from utilities.navx import NavX
 
 
@@ -15,17 +16,32 @@ class Lift:
 
     __slots__ = ("motor", "encoder", "forward_limit_switch")
 
-    def __init__(self, motor: rev.CANSparkMax) -> None:
+    def __init__(self, name: str, motor: rev.CANSparkMax) -> None:
         self.motor = motor
         self.encoder = motor.getEncoder()
         self.forward_limit_switch = motor.getForwardLimitSwitch(
             rev.LimitSwitchPolarity.kNormallyOpen
         )
 
-        self.motor.setIdleMode(rev.IdleMode.kBrake)
-        self.forward_limit_switch.enableLimitSwitch(True)
-        self.encoder.setPositionConversionFactor(self.HEIGHT_PER_REV)
-        self.encoder.setVelocityConversionFactor(self.HEIGHT_PER_REV / 60)
+        with motor_config.timed(name):
+            self.motor.setIdleMode(rev.IdleMode.kBrake)
+            self.forward_limit_switch.enableLimitSwitch(True)
+            # Setting these blocks, so only do so if they are not already set.
+            # The SparkMax stores them as 32 bit floats.
+            position_factor = self.HEIGHT_PER_REV
+            if not math.isclose(
+                self.encoder.getPositionConversionFactor(),
+                position_factor,
+                rel_tol=1e-6,
+            ):
+                self.encoder.setPositionConversionFactor(position_factor)
+            velocity_factor = self.HEIGHT_PER_REV / 60
+            if not math.isclose(
+                self.encoder.getVelocityConversionFactor(),
+                velocity_factor,
+                rel_tol=1e-6,
+            ):
+                self.encoder.setVelocityConversionFactor(velocity_factor)
 
     def is_retracted(self) -> bool:
         return self.forward_limit_switch.get()
@@ -57,11 +73,12 @@ class Climber:
     drive_output = magicbot.will_reset_to(0)
 
     def setup(self):
-        self.drive_motor.setNeutralMode(ctre.NeutralMode.Brake)
-        self.drive_motor.setInverted(True)
+        with motor_config.timed("climber drive"):
+            self.drive_motor.setNeutralMode(ctre.NeutralMode.Brake)
+            self.drive_motor.setInverted(True)
 
-        self.front = Lift(self.front_motor)
-        self.back = Lift(self.back_motor)
+        self.front = Lift("climber front lift", self.front_motor)
+        self.back = Lift("climber back lift", self.back_motor)
         self.lifts = (self.front, self.back)
 
         self.front_reverse_limit_switch = self.front_motor.getReverseLimitSwitch(
@@ -0,0 +1,184 @@
+"""Correction of the odometry by sighting vision targets at known places."""
+
+import math
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from components.vision import Vision
+from pyswervedrive.chassis import SwerveChassis
+from utilities.functions import constrain_angle, rotate_vector
+
+
+class FieldTarget(NamedTuple):
+    name: str
+    x: float
+    y: float
+    #: The heading the robot faces when scoring on the target
+    heading: float
+
+    def reflect(self) -> "FieldTarget":
+        return self._replace(y=-self.y, heading=-self.heading)
+
+
+CARGO_BAY_SPACING = 0.55  # m, between the bays on the side of the cargo ship
+
+#: The vision targets on the left of the field. These are the positions the
+#: autonomous Coordinates are offset from.
+LEFT_TARGETS = (
+    FieldTarget("cargo front", 5.5, 0.3, 0),
+    *(
+        FieldTarget(
+            f"cargo side {i + 1}", 6.6 + i * CARGO_BAY_SPACING, 0.8, -math.pi / 2
+        )
+        for i in range(3)
+    ),
+    FieldTarget("loading station", 0.2, 3.4, math.pi),
+)
+FIELD_TARGETS = LEFT_TARGETS + tuple(target.reflect() for target in LEFT_TARGETS)
+
+
+class Localisation:
+    """Corrects the chassis' odometry when the vision system sees a target.
+
+    Each sighting is matched to the nearest known target on the field, which
+    gives a measurement of where the robot was when the picture was taken.
+    This is fused with the odometry by a Kalman filter on the robot's
+    position. The filter is rewound to the time of the picture, updated, and
+    the odometry since then replayed. The odometry only adds up movements, so
+    replaying it is the same as moving every later pose by the correction.
+    """
+
+    chassis: SwerveChassis
+    vision: Vision
+
+    #: Variance of the position when the odometry is reset, in m^2
+    INITIAL_VARIANCE = 0.1 ** 2
+    #: Growth rate of the position variance as the odometry drifts, in m^2/s
+    PROCESS_NOISE = 0.02
+    #: Standard deviation of a sighting is this, in m...
+    MEASUREMENT_NOISE = 0.03
+    #: ...plus this fraction of the distance to the target
+    MEASUREMENT_NOISE_SCALE = 0.05
+    #: Furthest a sighting can be from a target and still be matched to it
+    MATCH_DISTANCE = 1.0  # m
+    #: How much nearer the matched target must be than any other. The side
+    #: cargo bays are CARGO_BAY_SPACING apart, so this allows about 0.2 m of
+    #: drift along the side of the cargo ship.
+    MATCH_MARGIN = 0.1  # m
+    #: Largest difference between our heading and the target's to match it
+    MAX_HEADING_ERROR = math.radians(30)
+    #: Squared Mahalanobis distance beyond which a sighting is rejected (99%
+    #: for two degrees of freedom)
+    GATE = 9.21
+
+    def __init__(self) -> None:
+        self.enabled = True
+        self.targets = FIELD_TARGETS
+        self.covariance = np.eye(2) * self.INITIAL_VARIANCE
+        #: Local time the covariance is for
+        self.time = time.monotonic()
+        self.last_fiducial_time = -1.0
+        #: The target of the last correction
+        self.target: Optional[FieldTarget] = None
+        self.corrections = 0
+        self.rejections = 0
+
+    def on_enable(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        """Start trusting the odometry again, such as after it is reset."""
+        self.covariance = np.eye(2) * self.INITIAL_VARIANCE
+        self.time = time.monotonic()
+
+    def execute(self) -> None:
+        frame = self.vision.frame
+        if (
+            not self.enabled
+            or frame.fiducial_time == self.last_fiducial_time
+            or not self.vision.fiducial_in_sight
+        ):
+            return
+        self.last_fiducial_time = frame.fiducial_time
+        self.correct(self.vision.vision_time, frame.fiducial_x, frame.fiducial_y)
+
+    def match(
+        self, x: float, y: float, heading: float, forwards: bool
+    ) -> Optional[FieldTarget]:
+        """Find the target a sighting is of.
+
+        Args:
+            x, y: the field position of the sighting.
+            heading: the robot's heading when the sighting was made.
+            forwards: whether the target was in front of the robot.
+
+        Returns:
+            The nearest target, if it is near enough, faces the right way and
+            is at least MATCH_MARGIN nearer than any other target.
+        """
+        camera_heading = heading if forwards else heading + math.pi
+        candidates = sorted(
+            (math.hypot(target.x - x, target.y - y), target)
+            for target in self.targets
+            if abs(constrain_angle(camera_heading - target.heading))
+            < self.MAX_HEADING_ERROR
+        )
+        if not candidates or candidates[0][0] > self.MATCH_DISTANCE:
+            return None
+        if (
+            len(candidates) > 1
+            and candidates[1][0] - candidates[0][0] < self.MATCH_MARGIN
+        ):
+            # Too close to call
+            return None
+        return candidates[0][1]
+
+    def correct(self, t: float, fiducial_x: float, fiducial_y: float) -> bool:
+        """Fuse a sighting into the odometry.
+
+        Args:
+            t: local time the picture was taken.
+            fiducial_x, fiducial_y: position of the target relative to the
+                robot when the picture was taken, in the robot frame.
+
+        Returns:
+            True if the odometry was corrected.
+        """
+        # Rewind to where we were when the picture was taken
+        x, y, heading = self.vision.odometry.at(t)
+        dx, dy = rotate_vector(fiducial_x, fiducial_y, heading)
+        target = self.match(x + dx, y + dy, heading, fiducial_x > 0)
+        if target is None:
+            return False
+
+        covariance = self.covariance + np.eye(2) * self.PROCESS_NOISE * max(
+            t - self.time, 0
+        )
+        # The difference between where the sighting says we were and the odometry
+        innovation = np.array((target.x - x - dx, target.y - y - dy))
+        noise = self.MEASUREMENT_NOISE + self.MEASUREMENT_NOISE_SCALE * math.hypot(
+            fiducial_x, fiducial_y
+        )
+        inverse = np.linalg.inv(covariance + np.eye(2) * noise ** 2)
+        if innovation @ inverse @ innovation > self.GATE:
+            self.rejections += 1
+            return False
+
+        gain = covariance @ inverse
+        correction_x, correction_y = gain @ innovation
+        self.covariance = (np.eye(2) - gain) @ covariance
+        self.time = t
+        # Replay the odometry since the picture from the corrected position
+        self.chassis.shift_odometry(correction_x, correction_y)
+        self.vision.shift_odometry(correction_x, correction_y, since=t)
+        self.target = target
+        self.corrections += 1
+        return True
+
+    @property
+    def uncertainty(self) -> float:
+        """The standard deviation of the position along its worst axis, as of
+        the last correction."""
+        return math.sqrt(np.linalg.eigvalsh(self.covariance)[-1])
@@ -1,39 +1,146 @@
+import math
 import time
 
-from collections import deque
-from typing import Deque, NamedTuple, Tuple
+from typing import NamedTuple, Tuple
 
 import hal
+import numpy as np
 from networktables import NetworkTablesInstance
 
 from pyswervedrive.chassis import SwerveChassis
+from utilities.clock_sync import ClockSync
 from utilities.functions import rotate_vector
+from utilities.pose_history import PoseHistory
+
+
+class VisionFrame(NamedTuple):
+    """The vision inputs from NetworkTables, as read at one instant."""
+
+    #: Incremented every time the inputs are read
+    seq: int
+    fiducial_x: float
+    fiducial_y: float
+    fiducial_time: float
+    raspi_pong_time: float
+    rio_pong_time: float
+    #: Local time the latest pong arrived
+    pong_received_time: float
+
+
+class TargetTracker:
+    """A Kalman filter estimating the position of a fixed target on the field.
+
+    Measurements are fused in the field frame, so between camera frames the
+    estimate follows the robot's odometry. The target itself does not move,
+    but its uncertainty grows over time to allow for odometry drift.
+    """
+
+    #: Growth rate of the position variance, in m^2/s
+    PROCESS_NOISE = 0.01
+    #: Standard deviation of a measurement is this, in m...
+    MEASUREMENT_NOISE = 0.02
+    #: ...plus this fraction of the distance to the target
+    MEASUREMENT_NOISE_SCALE = 0.05
+    #: Squared Mahalanobis distance beyond which a measurement is rejected
+    #: (99% for two degrees of freedom)
+    GATE = 9.21
+    #: Consecutive rejections after which the target is assumed to have
+    #: changed, and tracking restarts from the next measurement
+    MAX_REJECTIONS = 3
 
+    def __init__(self) -> None:
+        self.position = np.zeros(2)
+        self.covariance = np.zeros((2, 2))
+        self.tracking = False
+        self.time = 0.0
+        #: Local time the last measurement was fused
+        self.last_update = -math.inf
+        self.rejections = 0
+
+    def reset(self) -> None:
+        """Forget the target."""
+        self.tracking = False
+        self.rejections = 0
+        self.last_update = -math.inf
 
-class Odometry(NamedTuple):
-    x: float
-    y: float
-    heading: float
-    t: float
+    @property
+    def uncertainty(self) -> float:
+        """The standard deviation of the estimate along its worst axis."""
+        return math.sqrt(np.linalg.eigvalsh(self.covariance)[-1])
+
+    def predict(self, t: float) -> None:
+        """Advance the estimate to a time."""
+        dt = t - self.time
+        if dt > 0:
+            self.covariance += np.eye(2) * self.PROCESS_NOISE * dt
+            self.time = t
+
+    def update(self, x: float, y: float, distance: float) -> bool:
+        """Fuse a measurement of the target's field position.
+
+        Args:
+            x, y: the measured field position of the target.
+            distance: how far the robot was from the target when measured.
+
+        Returns:
+            False if the measurement was rejected as an outlier.
+        """
+        measurement = np.array((x, y))
+        noise = self.MEASUREMENT_NOISE + self.MEASUREMENT_NOISE_SCALE * distance
+        measurement_covariance = np.eye(2) * noise ** 2
+        if not self.tracking:
+            self.position = measurement
+            self.covariance = measurement_covariance
+            self.tracking = True
+            self.rejections = 0
+            self.last_update = self.time
+            return True
+
+        innovation = measurement - self.position
+        innovation_covariance = self.covariance + measurement_covariance
+        inverse = np.linalg.inv(innovation_covariance)
+        if innovation @ inverse @ innovation > self.GATE:
+            self.rejections += 1
+            if self.rejections >= self.MAX_REJECTIONS:
+                self.reset()
+            return False
+
+        gain = self.covariance @ inverse
+        self.position = self.position + gain @ innovation
+        self.covariance = (np.eye(2) - gain) @ self.covariance
+        self.rejections = 0
+        self.last_update = self.time
+        return True
+
+    def relative_to(self, x: float, y: float, heading: float) -> Tuple[float, float]:
+        """The position of the target relative to a robot pose, in the robot
+        frame."""
+        target_x, target_y = self.position
+        return rotate_vector(target_x - x, target_y - y, -heading)
 
 
 class Vision:
 
     chassis: SwerveChassis
 
+    #: How long the tracked target is trusted without a new measurement
+    TRACK_TIMEOUT = 1.0  # seconds
+    #: Largest uncertainty of the tracked target that is still trusted
+    MAX_TRACK_UNCERTAINTY = 0.3  # m
+
     # NOTE: x and y are relative to the robot co-ordinate system, not the camera
 
     @property
     def fiducial_x(self) -> float:
-        return self.fiducial_x_entry.getDouble(0.0)
+        return self.frame.fiducial_x
 
     @property
     def fiducial_y(self) -> float:
-        return self.fiducial_y_entry.getDouble(0.0)
+        return self.frame.fiducial_y
 
     @property
     def fiducial_time(self) -> float:
-        return self.fiducial_time_entry.getDouble(-1.0)
+        return self.frame.fiducial_time
 
     @property
     def ping_time(self) -> float:
@@ -45,18 +152,19 @@ class Vision:
 
     @property
     def raspi_pong_time(self) -> float:
-        return self.raspi_pong_time_entry.getDouble(0.0)
+        return self.frame.raspi_pong_time
 
     @property
     def rio_pong_time(self) -> float:
-        return self.rio_pong_time_entry.getDouble(0.0)
+        return self.frame.rio_pong_time
 
     @property
     def latency(self) -> float:
-        return self.latency_entry.getDouble(0.0)
+        return self._latency
 
     @latency.setter
     def latency(self, value: float) -> None:
+        self._latency = value
         self.latency_entry.setDouble(value)
 
     @property
@@ -69,8 +177,14 @@ class Vision:
 
     def __init__(self) -> None:
         self.last_pong = time.monotonic()
+        self._latency = 0.0
+        self.clock = ClockSync()
+        self.pong_received_time = 0.0
+        self.frame = VisionFrame(0, 0.0, 0.0, -1.0, 0.0, 0.0, 0.0)
+        self.tracker = TargetTracker()
+        self.last_fiducial_time = -1.0
         # 50Hz control loop for 2 seconds
-        self.odometry: Deque[Odometry] = deque(maxlen=50 * 2)
+        self.odometry = PoseHistory(50 * 2)
 
         self.ntinst = NetworkTablesInstance()
         if hal.isSimulation():
@@ -86,55 +200,117 @@ class Vision:
         self.raspi_pong_time_entry = self.ntinst.getEntry("/vision/raspi_pong")
         self.rio_pong_time_entry = self.ntinst.getEntry("/vision/rio_pong")
         self.latency_entry = self.ntinst.getEntry("/vision/clock_offset")
+        self.clock_confidence_entry = self.ntinst.getEntry("/vision/clock_confidence")
         self.processing_time_entry = self.ntinst.getEntry("/vision/processing_time")
         self.camera_entry = self.ntinst.getEntry("/vision/game_piece")
 
+        # Timestamp pongs as they arrive, rather than when they are next read
+        self.rio_pong_time_entry.addListener(
+            self._on_pong,
+            NetworkTablesInstance.NotifyFlags.NEW
+            | NetworkTablesInstance.NotifyFlags.UPDATE,
+        )
+
+    def _on_pong(self, entry, key, value, param) -> None:
+        self.pong_received_time = time.monotonic()
+
+    def read_frame(self) -> VisionFrame:
+        """Read all the vision inputs from NetworkTables at once.
+
+        Everything else reads the resulting frame, so the fiducial position
+        and time used in a control loop always come from the same update.
+        """
+        self.frame = VisionFrame(
+            self.frame.seq + 1,
+            self.fiducial_x_entry.getDouble(0.0),
+            self.fiducial_y_entry.getDouble(0.0),
+            self.fiducial_time_entry.getDouble(-1.0),
+            self.raspi_pong_time_entry.getDouble(0.0),
+            self.rio_pong_time_entry.getDouble(0.0),
+            self.pong_received_time,
+        )
+        return self.frame
+
     def execute(self) -> None:
         """Store the current odometry in the queue. Allows projection of target into current position."""
-        self.odometry.appendleft(
-            Odometry(
-                self.chassis.odometry_x,
-                self.chassis.odometry_y,
-                self.chassis.imu.getAngle(),
-                time.monotonic(),
-            )
-        )
+        self.read_frame()
+        pose = self.chassis.pose
+        # The chassis only updates the pose while it is running, not when disabled
+        if not len(self.odometry) or pose.t > self.odometry.latest()[3]:
+            self.odometry.append(pose.x, pose.y, pose.heading, pose.t)
         self.ping()
         self.pong()
-        vision_time = self.fiducial_time + self.latency
-        self.processing_time = time.monotonic() - vision_time
+        self.update_tracker()
+        self.processing_time = time.monotonic() - self.vision_time
         self.ntinst.flush()
 
+    @property
+    def vision_time(self) -> float:
+        """The time the fiducial was seen, on our clock."""
+        return self.clock.to_local(self.frame.fiducial_time)
+
     @property
     def fiducial_in_sight(self) -> bool:
-        return time.monotonic() - (self.fiducial_time + self.latency) < 0.1
+        return time.monotonic() - self.vision_time < 0.1
 
     def get_fiducial_position(self) -> Tuple[float, float, float]:
         """Return the position of the retroreflective fiducials relative to the current robot pose."""
-        vision_time = self.fiducial_time + self.latency
+        frame = self.frame
         vision_delta_x, vision_delta_y, vision_delta_heading = self._get_pose_delta(
-            vision_time
+            self.vision_time
         )
-        x = self.fiducial_x - vision_delta_x
-        y = self.fiducial_y - vision_delta_y
+        x = frame.fiducial_x - vision_delta_x
+        y = frame.fiducial_y - vision_delta_y
         return x, y, vision_delta_heading
 
+    def update_tracker(self) -> None:
+        """Fuse the latest fiducial, if there is a new one, into the tracker."""
+        frame = self.frame
+        self.tracker.predict(time.monotonic())
+        if frame.fiducial_time == self.last_fiducial_time or not self.fiducial_in_sight:
+            return
+        self.last_fiducial_time = frame.fiducial_time
+        # Where we were when the picture was taken
+        x, y, heading = self.odometry.at(self.vision_time)
+        dx, dy = rotate_vector(frame.fiducial_x, frame.fiducial_y, heading)
+        self.tracker.update(
+            x + dx, y + dy, math.hypot(frame.fiducial_x, frame.fiducial_y)
+        )
+
+    @property
+    def target_tracked(self) -> bool:
+        """Whether the tracked target's position is known well enough to use."""
+        tracker = self.tracker
+        return (
+            tracker.tracking
+            and tracker.time - tracker.last_update < self.TRACK_TIMEOUT
+            and tracker.uncertainty < self.MAX_TRACK_UNCERTAINTY
+        )
+
+    def get_target_position(self) -> Tuple[float, float]:
+        """Return the position of the tracked target relative to the current robot pose, in the robot frame."""
+        pose = self.chassis.pose
+        return self.tracker.relative_to(pose.x, pose.y, pose.heading)
+
+    def shift_odometry(self, dx: float, dy: float, since: float) -> None:
+        """Move the stored odometry from a time onwards by a correction.
+
+        The tracked target was placed using that odometry, so it moves too.
+        """
+        self.odometry.shift(dx, dy, since)
+        self.tracker.position = self.tracker.position + (dx, dy)
+
     def _get_pose_delta(self, t: float) -> Tuple[float, float, float]:
-        """Search the stored odometry and return the position difference between now and the specified time."""
-        current = previous = self.odometry[0]
-        for odom in self.odometry:
-            if odom.t >= t:
-                previous = odom
-            else:
-                break
-
-        x = current.x - previous.x
-        y = current.y - previous.y
+        """Interpolate the stored odometry and return the position difference between now and the specified time."""
+        current_x, current_y, current_heading, _ = self.odometry.latest()
+        previous_x, previous_y, heading = self.odometry.at(t)
+
+        x = current_x - previous_x
+        y = current_y - previous_y
         # Rotate to the robot frame of reference
         # Use the previous heading - that's where we were when the picture was taken
-        heading = previous.heading
         robot_x, robot_y = rotate_vector(x, y, -heading)
-        return robot_x, robot_y, current.heading - heading
+        return robot_x, robot_y, current_heading - heading
 
     def ping(self) -> None:
         """Send a ping to the RasPi to determine the connection latency."""
@@ -142,12 +318,17 @@ class Vision:
 
     def pong(self) -> None:
         """Receive a pong from the RasPi to determine the connection latency."""
-        if abs(self.rio_pong_time - self.last_pong) > 1e-4:  # Floating point comparison
-            alpha = 0.0  # Exponential averaging
-            self.latency = alpha * self.latency + (1 - alpha) * (
-                self.rio_pong_time - self.raspi_pong_time
-            )
-            self.last_pong = self.rio_pong_time
+        frame = self.frame
+        # Floating point comparison
+        if abs(frame.rio_pong_time - self.last_pong) > 1e-4:
+            # The pong carries the time of the ping it answers
+            received = frame.pong_received_time
+            if received < frame.rio_pong_time:
+                received = time.monotonic()
+            self.clock.add_sample(frame.rio_pong_time, frame.raspi_pong_time, received)
+            self.latency = self.clock.offset(received)
+            self.clock_confidence_entry.setDouble(self.clock.confidence)
+            self.last_pong = frame.rio_pong_time
 
     def use_hatch(self) -> None:
         """Switch to the hatch camera."""
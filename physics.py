@@ -1,8 +1,8 @@
 import math
 
 import ctre
-import numpy as np
 
+from pyswervedrive.kinematics import SwerveKinematics
 from pyswervedrive.module import SwerveModule
 from utilities.functions import constrain_angle
 
@@ -35,6 +35,9 @@ class PhysicsEngine:
         y_off = self.Y_WHEELBASE / 2
         self.module_x_offsets = [x_off, -x_off, -x_off, x_off]
         self.module_y_offsets = [y_off, y_off, -y_off, -y_off]
+        self.kinematics = SwerveKinematics(
+            list(zip(self.module_x_offsets, self.module_y_offsets))
+        )
 
         self.controller.add_device_gyro_channel("navxmxp_spi_4_angle")
 
@@ -81,61 +84,10 @@ class PhysicsEngine:
         lf_speed, lr_speed, rr_speed, rf_speed = motor_speeds
 
         lf_angle, lr_angle, rr_angle, rf_angle = steer_positions
-        vx, vy, vw = better_four_motor_swerve_drivetrain(
-            motor_speeds, steer_positions, self.module_x_offsets, self.module_y_offsets
-        )
+        vx, vy, vw = self.kinematics.forward_polar(
+            motor_speeds, steer_positions
+        ).tolist()
         # convert meters to ft. (cause america)
         vx /= 0.3048
         vy /= 0.3048
         self.controller.vector_drive(-vy, vx, -vw, tm_diff)
-
-
-def better_four_motor_swerve_drivetrain(
-    module_speeds, module_angles, module_x_offsets, module_y_offsets
-):
-    """Solve the least-squares of the speed and angles of four swerve modules
-    to retrieve delta x and y in the robot frame.
-
-    Note:
-        This function uses the standard (and superior) ROS coordinate system,
-        with forward being positive x, leftward being positive y, and a
-        counter clockwise rotation being one about the positive z axis.
-    Args:
-        module_speeds: List of the speeds of each module (m/s)
-        module_angles: List of the angles of each module (radians)
-        module_x_offsets: Offset of each module on the x axis.
-        module_y_offsets: Offset of each module on the y axis.
-    Returns:
-        vx: float, robot velocity on the x axis (m/s)
-        vy: float, robot velocity on the y axis (m/s)
-        vz: float, robot velocity about the z axis (radians/s)
-    """
-    A = np.array(
-        [
-            [1, 0, 1],
-            [0, 1, 1],
-            [1, 0, 1],
-            [0, 1, 1],
-            [1, 0, 1],
-            [0, 1, 1],
-            [1, 0, 1],
-            [0, 1, 1],
-        ],
-        dtype=float,
-    )
-    module_states = np.zeros((8, 1), dtype=float)
-    for i in range(4):
-        module_dist = math.hypot(module_x_offsets[i], module_y_offsets[i])
-        module_angle = math.atan2(module_y_offsets[i], module_x_offsets[i])
-        A[i * 2, 2] = -module_dist * math.sin(module_angle)
-        A[i * 2 + 1, 2] = module_dist * math.cos(module_angle)
-
-        x_vel = module_speeds[i] * math.cos(module_angles[i])
-        y_vel = module_speeds[i] * math.sin(module_angles[i])
-        module_states[i * 2, 0] = x_vel
-        module_states[i * 2 + 1, 0] = y_vel
-
-    lstsq_ret = np.linalg.lstsq(A, module_states, rcond=None)
-    vx, vy, vz = lstsq_ret[0].reshape(3)
-
-    return vx, vy, vz
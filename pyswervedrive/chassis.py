@@ -1,18 +1,46 @@
 import math
+import threading
 import time
-from typing import Tuple
+from typing import NamedTuple, Tuple
 
 import numpy as np
+import wpilib
 from magicbot import tunable
 from wpilib_controller import PIDController
 
+from utilities.functions import constrain_angle
 from utilities.navx import NavX
+from .kinematics import SwerveKinematics, desaturate, twist_to_delta
 from .module import SwerveModule
 
 
+class Pose(NamedTuple):
+    """A snapshot of the odometry.
+
+    The chassis replaces its pose with a new snapshot each time the odometry
+    is updated, so readers always see a consistent pose without locking.
+    """
+
+    x: float
+    y: float
+    heading: float
+    vx: float
+    vy: float
+    vz: float
+    #: time.monotonic() when the pose was measured
+    t: float
+
+
 class SwerveChassis:
     WIDTH = 0.75
     LENGTH = 0.75
+    ODOMETRY_PERIOD = 1 / 200
+    # a module this far from agreeing with the others is slipping or faulty
+    SLIP_RESIDUAL = 0.3  # m/s
+    # how quickly traction control backs off, and lets the commands recover
+    TRACTION_BACKOFF = 0.8  # per tick a module is slipping
+    TRACTION_RECOVERY = 2  # per second
+    MIN_TRACTION_SCALE = 0.3
 
     imu: NavX
     module_a: SwerveModule
@@ -33,9 +61,27 @@ class SwerveChassis:
         self.vx = 0
         self.vy = 0
         self.vz = 0
+        self.heading_rate = 0
         self.field_oriented = False
         self.momentum = False
         self.automation_running = False
+        # Integrate the encoder position deltas along arcs, rather than the
+        # velocity in a straight line
+        self.arc_odometry = True
+        # Run the odometry in its own thread, faster than the control loop
+        self.threaded_odometry = False
+        self.odometry_lock = threading.Lock()
+        self.pose = Pose(0, 0, 0, 0, 0, 0, 0)
+
+        # Limits on the acceleration of the commanded motion. Lower these
+        # when the robot is more likely to tip, e.g. with a mechanism raised.
+        self.acceleration_limit = 4  # m/s^2
+        self.angular_acceleration_limit = 15  # rad/s^2
+        # Slow down while wheels are slipping, see limit_motion
+        self.traction_control = True
+        self.traction_scale = 1.0
+        self.last_command = (0.0, 0.0, 0.0)
+        self.last_command_time = 0.0
 
     def setup(self):
         # Heading PID controller
@@ -53,33 +99,27 @@ class SwerveChassis:
         self.odometry_y_vel = 0
         self.odometry_z_vel = 0
 
-        self.A = np.array(
-            [
-                [1, 0, 1],
-                [0, 1, 1],
-                [1, 0, 1],
-                [0, 1, 1],
-                [1, 0, 1],
-                [0, 1, 1],
-                [1, 0, 1],
-                [0, 1, 1],
-            ],
-            dtype=float,
-        )
-
         self.last_odometry_time = 0
+        self.last_heading = 0
+        self.odometry_notifier = wpilib.Notifier(self.update_odometry)
         # wpilib.SmartDashboard.putData("heading_pid", self.heading_pid)
 
-        # figure out the contribution of the robot's overall rotation about the
-        # z axis to each module's movement, and encode that information in a
-
-        for i, module in enumerate(self.modules):
-            module_dist = math.hypot(module.x_pos, module.y_pos)
-            module_angle = math.atan2(module.y_pos, module.x_pos)
-            # self.z_axis_adjustment[i*2, 0] = -module_dist*math.sin(module_angle)
-            # self.z_axis_adjustment[i*2+1, 0] = module_dist*math.cos(module_angle)
-            self.A[i * 2, 2] = -module_dist * math.sin(module_angle)
-            self.A[i * 2 + 1, 2] = module_dist * math.cos(module_angle)
+        self.kinematics = SwerveKinematics(
+            [(module.x_pos, module.y_pos) for module in self.modules]
+        )
+        self.max_module_speed = min(module.max_drive_speed for module in self.modules)
+        #: Sensor readings of each module this tick: azimuth, wheel position
+        #: and wheel velocity, see read_modules
+        self.module_states = np.zeros((len(self.modules), 3))
+        # Health of the modules, see check_module_health
+        self.forward_matrix = self.kinematics.forward_matrix
+        self.module_residuals = np.zeros(len(self.modules))
+        self.module_fit = np.zeros(2 * len(self.modules))
+        self.module_faults = np.zeros(len(self.modules), dtype=int)
+        self.excluded_module = None
+        self.odometry_outputs = np.zeros(2 * len(self.modules))
+        self.velocity_outputs = np.zeros(2 * len(self.modules))
+        self.chassis_movement = np.zeros(3)
 
     def set_heading_sp_current(self):
         self.set_heading_sp(self.imu.getAngle())
@@ -100,10 +140,19 @@ class SwerveChassis:
 
         self.last_heading = self.imu.getAngle()
         self.odometry_updated = False
+        self.read_modules()
         for module in self.modules:
             module.reset_encoder_delta()
 
         self.last_odometry_time = time.monotonic()
+        self.last_command = (0.0, 0.0, 0.0)
+        self.last_command_time = self.last_odometry_time
+        self.traction_scale = 1.0
+        if self.threaded_odometry:
+            self.odometry_notifier.startPeriodic(self.ODOMETRY_PERIOD)
+
+    def on_disable(self):
+        self.odometry_notifier.stop()
 
     def execute(self):
 
@@ -123,102 +172,250 @@ class SwerveChassis:
         input_vz = 0
         if self.vz is not None:
             input_vz = self.vz
+        else:
+            # Feedforward while following a heading profile
+            input_vz = self.heading_rate
         if abs(pid_z) < 0.1 and math.hypot(self.vx, self.vy) < 0.01:
             pid_z = 0
         vz = input_vz + pid_z
 
         angle = self.imu.getAngle()
 
-        # TODO: re-enable if we end up not using callback method
-        self.update_odometry()
-        # self.odometry_updated = False  # reset for next timestep
+        if not self.threaded_odometry:
+            self.update_odometry()
+        self.set_modules_drive_brake()
 
-        for module in self.modules:
-            # Calculate the additional vx and vy components for this module
-            # required to achieve our desired angular velocity
-            vz_x = -module.dist * vz * math.sin(module.angle)
-            vz_y = module.dist * vz * math.cos(module.angle)
-            if self.field_oriented:
-                vx, vy = self.robot_orient(self.vx, self.vy, angle)
-            else:
-                vx, vy = self.vx, self.vy
-            module.set_velocity(vx + vz_x, vy + vz_y, absolute_rotation=False)
+        if self.field_oriented:
+            vx, vy = self.vx, self.vy
+        else:
+            vx, vy = self.field_orient(self.vx, self.vy, angle)
+        vx, vy, vz = self.limit_motion(vx, vy, vz)
+        vx, vy = self.robot_orient(vx, vy, angle)
+        # Find every module's velocity at once, then slow them all down
+        # together if any module can't keep up
+        module_velocities = desaturate(
+            self.kinematics.inverse((vx, vy, vz)), self.max_module_speed
+        )
+        for module, (module_vx, module_vy) in zip(
+            self.modules, module_velocities.tolist()
+        ):
+            module.set_velocity(module_vx, module_vy, absolute_rotation=False)
 
         if abs(math.hypot(self.vx, self.vy)) > 0.5:
             self.heading_pid.setP(2.0)
         else:
             self.heading_pid.setP(6.0)
 
-    def update_odometry(self, *args):
-        # TODO: re-enable if we end up not using callback method
-        # if self.odometry_updated:
-        #     return
-        heading = self.imu.getAngle()
+    def limit_motion(
+        self, vx: float, vy: float, vz: float
+    ) -> Tuple[float, float, float]:
+        """Limit the acceleration of a field oriented command.
 
-        odometry_outputs = np.zeros((8, 1))
-        velocity_outputs = np.zeros((8, 1))
+        The translational acceleration is limited as a vector, so the robot
+        still heads in the commanded direction. With traction control, the
+        command is also scaled back while an aligned wheel is slipping, and
+        allowed to recover once all the wheels grip again.
 
-        # betas = []
-        # phi_dots = []
-        for i, module in enumerate(self.modules):
-            module.update_odometry()
-            odometry_x, odometry_y = module.get_cartesian_delta()
-            velocity_x, velocity_y = module.get_cartesian_vel()
-            odometry_outputs[i * 2, 0] = odometry_x
-            odometry_outputs[i * 2 + 1, 0] = odometry_y
-            velocity_outputs[i * 2, 0] = velocity_x
-            velocity_outputs[i * 2 + 1, 0] = velocity_y
-            module.reset_encoder_delta()
-            # betas.append(module.measured_azimuth)
-            # phi_dots.append(module.wheel_angular_vel)
+        This applies to every command, including driver control in teleop.
+        """
+        now = time.monotonic()
+        dt = min(now - self.last_command_time, 0.1)
+        self.last_command_time = now
+
+        if self.traction_control:
+            # Only a module pointing where it is driving can be slipping. The
+            # others are still steering, and are dragged by the rest.
+            excluded = self.excluded_module
+            if excluded is not None and self.modules[excluded].aligned:
+                self.traction_scale = max(
+                    self.traction_scale * self.TRACTION_BACKOFF,
+                    self.MIN_TRACTION_SCALE,
+                )
+            else:
+                self.traction_scale = min(
+                    self.traction_scale + self.TRACTION_RECOVERY * dt, 1.0
+                )
+            vx *= self.traction_scale
+            vy *= self.traction_scale
+            vz *= self.traction_scale
+
+        last_vx, last_vy, last_vz = self.last_command
+        dvx = vx - last_vx
+        dvy = vy - last_vy
+        dv = math.hypot(dvx, dvy)
+        max_dv = self.acceleration_limit * dt
+        if dv > max_dv:
+            dvx *= max_dv / dv
+            dvy *= max_dv / dv
+        max_dvz = self.angular_acceleration_limit * dt
+        dvz = min(max(vz - last_vz, -max_dvz), max_dvz)
+
+        self.last_command = last_vx + dvx, last_vy + dvy, last_vz + dvz
+        return self.last_command
 
-        # q = np.array(betas)
-        # lambda_e = self.icre.estimate_lmda(q)
-        # print(lambda_e)
+    def update_odometry(self, *args):
+        """Sample the sensors and integrate the odometry, then publish the pose.
 
-        now = time.monotonic()
-        vx, vy, vz = self.robot_movement_from_odometry(velocity_outputs, heading)
-        # delta_x, delta_y, delta_z = self.robot_movement_from_odometry(
-        # odometry_outputs, heading, z_vel=self.imu.getHeadingRate()
-        # )
+        This runs from execute, or at ODOMETRY_PERIOD in its own thread if
+        threaded_odometry is set.
+        """
+        with self.odometry_lock:
+            heading = self.imu.getAngle()
+
+            odometry_outputs = self.odometry_outputs
+            velocity_outputs = self.velocity_outputs
+
+            self.read_modules()
+            azimuth = self.module_states[:, 0]
+            wheel_vel = self.module_states[:, 2]
+            np.multiply(wheel_vel, np.cos(azimuth), out=velocity_outputs[0::2])
+            np.multiply(wheel_vel, np.sin(azimuth), out=velocity_outputs[1::2])
+            self.check_module_health(velocity_outputs)
+
+            # betas = []
+            # phi_dots = []
+            for i, module in enumerate(self.modules):
+                odometry_x, odometry_y = module.get_cartesian_delta()
+                odometry_outputs[i * 2] = odometry_x
+                odometry_outputs[i * 2 + 1] = odometry_y
+                module.reset_encoder_delta()
+                # betas.append(module.measured_azimuth)
+                # phi_dots.append(module.wheel_angular_vel)
+
+            # q = np.array(betas)
+            # lambda_e = self.icre.estimate_lmda(q)
+            # print(lambda_e)
+
+            now = time.monotonic()
+            vx, vy, vz = self.robot_movement_from_odometry(velocity_outputs, heading)
+            # delta_x, delta_y, delta_z = self.robot_movement_from_odometry(
+            # odometry_outputs, heading, z_vel=self.imu.getHeadingRate()
+            # )
+
+            if self.arc_odometry:
+                np.dot(self.forward_matrix, odometry_outputs, out=self.chassis_movement)
+                robot_dx, robot_dy, _ = self.chassis_movement.tolist()
+                # The IMU measures the rotation better than the wheels can
+                dtheta = constrain_angle(heading - self.last_heading)
+                delta_x, delta_y = self.field_orient(
+                    *twist_to_delta(robot_dx, robot_dy, dtheta), self.last_heading
+                )
+            else:
+                delta_t = now - self.last_odometry_time
+                delta_x = vx * delta_t
+                delta_y = vy * delta_t
+
+            self.odometry_x += delta_x
+            self.odometry_y += delta_y
+            self.odometry_x_vel = vx
+            self.odometry_y_vel = vy
+            self.odometry_z_vel = vz
+
+            self.last_heading = heading
+
+            self.odometry_updated = True
+
+            self.last_odometry_time = now
+            self.publish_pose()
+
+    def reset_odometry(self, x: float, y: float) -> None:
+        """Set the position of the robot on the field."""
+        with self.odometry_lock:
+            self.odometry_x = x
+            self.odometry_y = y
+            self.publish_pose()
+
+    def shift_odometry(self, dx: float, dy: float) -> None:
+        """Move the position of the robot on the field by a correction."""
+        with self.odometry_lock:
+            self.odometry_x += dx
+            self.odometry_y += dy
+            self.publish_pose()
+
+    def publish_pose(self) -> None:
+        """Replace the pose snapshot with the current odometry."""
+        self.pose = Pose(
+            self.odometry_x,
+            self.odometry_y,
+            self.last_heading,
+            self.odometry_x_vel,
+            self.odometry_y_vel,
+            self.odometry_z_vel,
+            self.last_odometry_time,
+        )
 
-        delta_t = now - self.last_odometry_time
-        delta_x = vx * delta_t
-        delta_y = vy * delta_t
+    def read_modules(self):
+        """Sample the sensors of every module, together, into module_states.
 
-        self.odometry_x += delta_x
-        self.odometry_y += delta_y
-        self.odometry_x_vel = vx
-        self.odometry_y_vel = vy
-        self.odometry_z_vel = vz
+        This is the only place the module sensors are read each tick, so
+        odometry and the module commands all work from the same instant.
+        """
+        for module in self.modules:
+            module.update_odometry()
+        self.module_states[:] = [
+            (module.measured_azimuth, module.wheel_pos, module.wheel_vel)
+            for module in self.modules
+        ]
 
-        self.last_heading = heading
+    def check_module_health(self, module_velocities: np.ndarray) -> None:
+        """Check the modules agree with each other, and leave out any that don't.
 
-        self.odometry_updated = True
+        When a wheel slips or a module's encoder fails, its velocity no longer
+        fits the kinematics of the rest. The module that fits worst is then
+        left out of the odometry until it agrees again.
 
-        self.set_modules_drive_brake()
+        A module that is still steering to its new direction is dragged along
+        by the others, so it doesn't fit either. Those modules are not
+        treated as slipping.
 
-        self.last_odometry_time = now
+        Args:
+            module_velocities: the interleaved x and y velocity of each module.
+        """
+        kinematics = self.kinematics
+        # Residual of each module from the least squares fit of all of them
+        fit = self.module_fit
+        np.dot(kinematics.forward_matrix, module_velocities, out=self.chassis_movement)
+        np.dot(kinematics.inverse_matrix, self.chassis_movement, out=fit)
+        np.subtract(module_velocities, fit, out=fit)
+        np.hypot(fit[0::2], fit[1::2], out=self.module_residuals)
+        for i, module in enumerate(self.modules):
+            if not module.aligned:
+                self.module_residuals[i] = 0.0
+
+        self.excluded_module = None
+        self.forward_matrix = kinematics.forward_matrix
+        if self.module_residuals.max() > self.SLIP_RESIDUAL and len(
+            kinematics.forward_matrices_excluding
+        ):
+            self.excluded_module = kinematics.outlier(module_velocities.reshape(-1, 2))
+            self.forward_matrix = kinematics.forward_matrices_excluding[
+                self.excluded_module
+            ]
+            if self.modules[self.excluded_module].aligned:
+                self.module_faults[self.excluded_module] += 1
 
     def robot_movement_from_odometry(self, odometry_outputs, angle, z_vel=0):
-        lstsq_ret = np.linalg.lstsq(self.A, odometry_outputs, rcond=None)
-        x, y, theta = lstsq_ret[0].reshape(3)
+        np.dot(self.forward_matrix, odometry_outputs, out=self.chassis_movement)
+        x, y, theta = self.chassis_movement.tolist()
         # TODO: re-enable if we move back to running in the same thread
         x_field, y_field = self.field_orient(x, y, angle + z_vel * (1 / 200))
         # x_field, y_field = self.field_orient(x, y, angle)
         return x_field, y_field, theta
 
-    def set_velocity_heading(self, vx, vy, heading):
+    def set_velocity_heading(self, vx, vy, heading, heading_rate=0):
         """Set a translational velocity and a rotational orientation to achieve.
 
         Args:
             vx: (forward) component of the robot's desired velocity. In m/s.
             vy: (leftward) component of the robot's desired velocity. In m/s.
             heading: the heading the robot is to face.
+            heading_rate: feedforward for the rate the heading setpoint is
+                changing at, so the robot rotates while it drives. In radians/s.
         """
         self.vx = vx
         self.vy = vy
         self.vz = None
+        self.heading_rate = heading_rate
         self.set_heading_sp(heading)
 
     def set_inputs(
@@ -235,6 +432,7 @@ class SwerveChassis:
         self.vx = vx
         self.vy = vy
         self.vz = vz
+        self.heading_rate = 0
         self.field_oriented = field_oriented
 
     @staticmethod
@@ -277,11 +475,13 @@ class SwerveChassis:
 
     @property
     def position(self):
-        return self.odometry_x, self.odometry_y
+        pose = self.pose
+        return pose.x, pose.y
 
     @property
     def speed(self):
-        return math.hypot(self.odometry_x_vel, self.odometry_y_vel)
+        pose = self.pose
+        return math.hypot(pose.vx, pose.vy)
 
     @property
     def all_aligned(self):
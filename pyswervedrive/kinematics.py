@@ -0,0 +1,184 @@
+import math
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+class SwerveKinematics:
+    """Kinematics of a swerve drive with any number of modules.
+
+    Uses the ROS coordinate system, with forward being positive x, leftward
+    being positive y, and a counter clockwise rotation being one about the
+    positive z axis.
+
+    Every method works on a single state or on a batch of them: any leading
+    dimensions of the arguments are carried through to the result, so a log
+    of T ticks can be processed as a (T, N) array in one call.
+    """
+
+    def __init__(self, module_positions: Sequence[Tuple[float, float]]) -> None:
+        """
+        Args:
+            module_positions: the (x, y) position of each module relative to
+                the centre of rotation, in metres.
+        """
+        self.positions = np.array(module_positions, dtype=float).reshape(-1, 2)
+        self.num_modules = len(self.positions)
+        x, y = self.positions.T
+
+        #: Maps (vx, vy, vz) to the interleaved x and y velocity of each module
+        self.inverse_matrix = np.zeros((2 * self.num_modules, 3))
+        self.inverse_matrix[0::2, 0] = 1
+        self.inverse_matrix[1::2, 1] = 1
+        self.inverse_matrix[0::2, 2] = -y
+        self.inverse_matrix[1::2, 2] = x
+        #: The least squares solution of the inverse kinematics
+        self.forward_matrix = np.linalg.pinv(self.inverse_matrix)
+        #: forward_matrix with each module left out in turn, (N, 3, 2N). Only
+        #: available with at least three modules.
+        self.forward_matrices_excluding = np.zeros((0, 3, 2 * self.num_modules))
+        if self.num_modules >= 3:
+            self.forward_matrices_excluding = np.stack(
+                [self._forward_matrix_excluding(i) for i in range(self.num_modules)]
+            )
+
+    def _forward_matrix_excluding(self, module: int) -> np.ndarray:
+        """The forward kinematics matrix, ignoring one module."""
+        rows = np.ones(2 * self.num_modules, dtype=bool)
+        rows[2 * module : 2 * module + 2] = False
+        matrix = np.zeros((3, 2 * self.num_modules))
+        matrix[:, rows] = np.linalg.pinv(self.inverse_matrix[rows])
+        return matrix
+
+    def forward(self, module_velocities: np.ndarray) -> np.ndarray:
+        """Find the chassis velocity that best fits the module velocities.
+
+        Args:
+            module_velocities: (..., N, 2) x and y velocity of each module, in
+                the robot frame.
+
+        Returns:
+            (..., 3) array of vx and vy in m/s and vz in radians/s.
+        """
+        v = np.asarray(module_velocities, dtype=float)
+        v = v.reshape(v.shape[:-2] + (2 * self.num_modules,))
+        return v @ self.forward_matrix.T
+
+    def residuals(
+        self, module_velocities: np.ndarray, chassis_velocity: np.ndarray
+    ) -> np.ndarray:
+        """Find how far each module is from the velocity a chassis velocity needs.
+
+        Args:
+            module_velocities: (..., N, 2) measured velocity of each module.
+            chassis_velocity: (..., 3) chassis velocity to compare against.
+
+        Returns:
+            (..., N) magnitude of each module's velocity error, in m/s.
+        """
+        error = np.asarray(module_velocities, dtype=float)
+        error = error - self.inverse(chassis_velocity)
+        return np.hypot(error[..., 0], error[..., 1])
+
+    def outlier(self, module_velocities: np.ndarray) -> int:
+        """Find the module that least agrees with the others.
+
+        This is the module that, when left out, lets the forward kinematics
+        best fit the rest of the modules.
+
+        Args:
+            module_velocities: (N, 2) measured velocity of each module.
+        """
+        v = np.asarray(module_velocities, dtype=float).reshape(-1)
+        # Fit the chassis velocity with each module left out in turn
+        fits = self.forward_matrices_excluding @ v
+        errors = v - fits @ self.inverse_matrix.T
+        errors = np.square(errors).reshape(self.num_modules, self.num_modules, 2)
+        errors = errors.sum(axis=-1)
+        # Only count the error of the modules each fit used
+        np.fill_diagonal(errors, 0)
+        return int(np.argmin(errors.sum(axis=-1)))
+
+    def forward_polar(self, speeds: np.ndarray, angles: np.ndarray) -> np.ndarray:
+        """Find the chassis velocity from module speeds and azimuths.
+
+        Args:
+            speeds: (..., N) speed of each module, in m/s.
+            angles: (..., N) azimuth of each module, in radians.
+
+        Returns:
+            (..., 3) array of vx and vy in m/s and vz in radians/s.
+        """
+        speeds = np.asarray(speeds, dtype=float)
+        angles = np.asarray(angles, dtype=float)
+        module_velocities = np.stack(
+            (speeds * np.cos(angles), speeds * np.sin(angles)), axis=-1
+        )
+        return self.forward(module_velocities)
+
+    def inverse(self, chassis_velocity: np.ndarray) -> np.ndarray:
+        """Find the velocity each module needs for a chassis velocity.
+
+        Args:
+            chassis_velocity: (..., 3) array of vx and vy in m/s and vz in
+                radians/s, in the robot frame.
+
+        Returns:
+            (..., N, 2) x and y velocity of each module.
+        """
+        c = np.asarray(chassis_velocity, dtype=float)
+        v = c @ self.inverse_matrix.T
+        return v.reshape(c.shape[:-1] + (self.num_modules, 2))
+
+    def inverse_polar(
+        self, chassis_velocity: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the speed and azimuth each module needs for a chassis velocity.
+
+        Returns:
+            (..., N) arrays of the speed (m/s) and azimuth (radians) of
+            each module.
+        """
+        v = self.inverse(chassis_velocity)
+        return np.hypot(v[..., 0], v[..., 1]), np.arctan2(v[..., 1], v[..., 0])
+
+
+def desaturate(module_velocities: np.ndarray, max_speed: float) -> np.ndarray:
+    """Scale module velocities down so that no module exceeds a speed limit.
+
+    All the modules of a state are scaled by the same factor, so the chassis
+    still moves in the commanded direction, just more slowly.
+
+    Args:
+        module_velocities: (..., N, 2) x and y velocity of each module.
+        max_speed: the fastest any module can go, in m/s.
+    """
+    v = np.asarray(module_velocities, dtype=float)
+    fastest = np.hypot(v[..., 0], v[..., 1]).max(axis=-1, keepdims=True)
+    scale = max_speed / np.maximum(fastest, max_speed)
+    return v * scale[..., None]
+
+
+def twist_to_delta(dx: float, dy: float, dtheta: float) -> Tuple[float, float]:
+    """Find how far the robot moved over a tick from its twist.
+
+    The robot is assumed to have moved along a circular arc, turning at a
+    constant rate (the exponential map of SE(2)), rather than in a straight
+    line and then turning.
+
+    Args:
+        dx: distance travelled forwards, measured along the arc.
+        dy: distance travelled leftwards, measured along the arc.
+        dtheta: how far the robot turned, in radians.
+
+    Returns:
+        The displacement of the robot, in its frame at the start of the tick.
+    """
+    if abs(dtheta) < 1e-9:
+        # Use the Taylor expansions to avoid dividing by zero
+        s = 1 - dtheta * dtheta / 6
+        c = dtheta / 2
+    else:
+        s = math.sin(dtheta) / dtheta
+        c = (1 - math.cos(dtheta)) / dtheta
+    return s * dx - c * dy, c * dx + s * dy
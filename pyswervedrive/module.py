@@ -33,6 +33,32 @@ class SwerveModule:
     drive_velocity_to_native_units = drive_counts_per_metre * 0.1
     drive_angular_vel_to_native_units = drive_counts_per_radian * 0.1
 
+    STEER_CONFIG = {
+        (ctre.ParamEnum.eProfileParamSlot_F, 0): 1023 / STEER_FREE_SPEED,
+        (ctre.ParamEnum.eProfileParamSlot_P, 0): 0.75,
+        (ctre.ParamEnum.eProfileParamSlot_I, 0): 0.0,
+        (ctre.ParamEnum.eProfileParamSlot_D, 0): 0.0,
+        (ctre.ParamEnum.eMotMag_VelCruise, 0): 2000,
+        (ctre.ParamEnum.eMotMag_Accel, 0): 10000,
+        (ctre.ParamEnum.ePeakCurrentLimitAmps, 0): 10,
+        (ctre.ParamEnum.ePeakCurrentLimitMs, 0): 1,
+        (ctre.ParamEnum.eContinuousCurrentLimitAmps, 0): 10,
+    }
+    # TODO: change back to original constants once we get on to real robot
+    DRIVE_CONFIG = {
+        (ctre.ParamEnum.eProfileParamSlot_P, 0): 0.015,
+        (ctre.ParamEnum.eProfileParamSlot_I, 0): 0.0,
+        (ctre.ParamEnum.eProfileParamSlot_D, 0): 0.0,
+        (ctre.ParamEnum.eProfileParamSlot_F, 0): 1024.0 / DRIVE_FREE_SPEED,
+        (ctre.ParamEnum.eClosedloopRamp, 0): 0.45,
+        (ctre.ParamEnum.eNominalBatteryVoltage, 0): 9,
+        (ctre.ParamEnum.ePeakCurrentLimitAmps, 0): 50,
+        (ctre.ParamEnum.eContinuousCurrentLimitAmps, 0): 40,
+        (ctre.ParamEnum.ePeakCurrentLimitMs, 0): 10,  # TODO tune this
+    }
+    # fastest the drive motor can move the wheel along the ground, in m/s
+    max_drive_speed = DRIVE_FREE_SPEED / drive_velocity_to_native_units
+
     def __init__(
         self,
         name: str,
@@ -73,15 +99,14 @@ class SwerveModule:
         )
 
         self.last_speed = 0.0
+        # Whether the module is pointing where it is driving, see set_velocity
+        self.aligned = True
 
         self.update_odometry()
 
-        # NOTE: In all the following config* calls to the drive and steer
-        # motors, the last argument is the timeout in milliseconds. See
-        # robotpy-ctre documentation for details.
-
+        # Most of the configuration is applied in bulk, see controller_configs
         self.steer_motor.configSelectedFeedbackSensor(
-            ctre.FeedbackDevice.CTRE_MagEncoder_Absolute, 0, 10
+            ctre.FeedbackDevice.CTRE_MagEncoder_Absolute, 0, 0
         )
         # changes direction of motor encoder
         self.steer_motor.setSensorPhase(self.reverse_steer_encoder)
@@ -90,23 +115,13 @@ class SwerveModule:
         # self.steer_motor.setSelectedSensorPosition(0)
 
         self.steer_motor.selectProfileSlot(0, 0)
-        self.steer_motor.config_kF(0, 1023 / self.STEER_FREE_SPEED, 10)
-        self.steer_motor.config_kP(0, 0.75, 10)
-        self.steer_motor.config_kI(0, 0.0, 10)
-        self.steer_motor.config_kD(0, 0.0, 10)
-        self.steer_motor.configMotionCruiseVelocity(2000, 10)
-        self.steer_motor.configMotionAcceleration(10000, 10)
-
-        self.steer_motor.configPeakCurrentLimit(10, timeoutMs=10)
-        self.steer_motor.configPeakCurrentDuration(milliseconds=1, timeoutMs=10)
-        self.steer_motor.configContinuousCurrentLimit(10, timeoutMs=10)
         # TODO tune all of this
         self.steer_motor.enableCurrentLimit(True)
 
         self.steer_motor.setNeutralMode(ctre.NeutralMode.Coast)
 
         self.drive_motor.configSelectedFeedbackSensor(
-            ctre.FeedbackDevice.QuadEncoder, 0, 10
+            ctre.FeedbackDevice.QuadEncoder, 0, 0
         )
         # changes direction of motor encoder
         self.drive_motor.setSensorPhase(self.reverse_drive_encoder)
@@ -114,25 +129,25 @@ class SwerveModule:
         self.drive_motor.setInverted(self.reverse_drive_direction)
         # Reset drive encoder to 0
         self.drive_motor.setSelectedSensorPosition(0)
-        # TODO: change back to original constants once we get on to real robot
-        self.drive_motor.config_kP(0, 0.015, 10)
-        self.drive_motor.config_kI(0, 0, 10)
-        self.drive_motor.config_kD(0, 0, 10)
-        self.drive_motor.config_kF(0, 1024.0 / self.DRIVE_FREE_SPEED, 10)
-        self.drive_motor.configClosedLoopRamp(0.45, 10)
         self.drive_motor.selectProfileSlot(0, 0)
 
         self.drive_motor.setNeutralMode(ctre.NeutralMode.Brake)
 
         self.reset_encoder_delta()
 
-        self.drive_motor.configVoltageCompSaturation(9, timeoutMs=10)
-        self.drive_motor.configPeakCurrentLimit(50, timeoutMs=10)
-        self.drive_motor.configContinuousCurrentLimit(40, timeoutMs=10)
-        self.drive_motor.configPeakCurrentDuration(10, timeoutMs=10)  # TODO tune this
         self.drive_motor.enableCurrentLimit(True)
         self.drive_motor.enableVoltageCompensation(True)
 
+    def controller_configs(self):
+        """The configuration of each of the module's motor controllers.
+
+        See utilities.motor_config.configure for applying them.
+        """
+        return (
+            (f"module {self.name} steer", self.steer_motor, self.STEER_CONFIG),
+            (f"module {self.name} drive", self.drive_motor, self.DRIVE_CONFIG),
+        )
+
     def nt_offset_changed(self, entry, key: str, value: float, flags: int):
         value = int(value)
         self.steer_enc_offset = value
@@ -151,7 +166,7 @@ class SwerveModule:
         This is intended to be called by the SwerveChassis in order to track
         odometry.
         """
-        self.zero_azimuth = self.read_azimuth()
+        self.zero_azimuth = self.measured_azimuth
         self.zero_drive_pos = self.wheel_pos
 
     def get_encoder_delta(self):
@@ -160,7 +175,7 @@ class SwerveModule:
         This is intended to be called by the SwerveChassis in order to track
         odometry.
         """
-        steer_delta = constrain_angle(self.read_azimuth() - self.zero_azimuth)
+        steer_delta = constrain_angle(self.measured_azimuth - self.zero_azimuth)
         drive_delta = self.wheel_pos - self.zero_drive_pos
         return steer_delta, drive_delta
 
@@ -172,7 +187,7 @@ class SwerveModule:
         """
         azimuth_delta, drive_delta = self.get_encoder_delta()
 
-        avg_azimuth = self.read_azimuth() - (azimuth_delta / 2)
+        avg_azimuth = self.measured_azimuth - (azimuth_delta / 2)
 
         if abs(azimuth_delta) > 0.0001:
             # correct for the fact that when we are rotating the modules move in
@@ -187,7 +202,7 @@ class SwerveModule:
         return (drive_x_delta, drive_y_delta)
 
     def get_cartesian_vel(self):
-        azimuth = self.read_azimuth()
+        azimuth = self.measured_azimuth
         drive_speed = self.wheel_vel
 
         drive_x_vel = drive_speed * math.cos(azimuth)
@@ -201,7 +216,7 @@ class SwerveModule:
         :param vx: desired x velocity, m/s (x is forward on the robot)
         :param vy: desired y velocity, m/s (y is left on the robot)
         """
-        measured_azimuth = self.read_azimuth()
+        measured_azimuth = self.measured_azimuth
         speed = math.hypot(vx, vy)
         if speed == 0:
             if self.last_speed != 0:
@@ -263,16 +278,21 @@ class SwerveModule:
             )
 
     def update_odometry(self):
+        """Read all of the module's sensors.
+
+        Everything else works from these readings, so this must be called
+        once at the start of each control loop.
+        """
+        steer_pos = self.steer_motor.getSelectedSensorPosition(0)
+        self.measured_azimuth = (
+            steer_pos - self.steer_enc_offset
+        ) / self.STEER_COUNTS_PER_RADIAN
         drive_pos = self.drive_motor.getSelectedSensorPosition(0)
         drive_vel = self.drive_motor.getSelectedSensorVelocity(0)
         self.wheel_vel = drive_vel / self.drive_velocity_to_native_units
         self.wheel_angular_vel = drive_vel / self.drive_angular_vel_to_native_units
         self.wheel_pos = drive_pos / self.drive_counts_per_metre
 
-    def read_azimuth(self):
-        steer_pos = self.steer_motor.getSelectedSensorPosition(0)
-        return (steer_pos - self.steer_enc_offset) / self.STEER_COUNTS_PER_RADIAN
-
     @staticmethod
     def min_angular_displacement(current, target):
         """Get the minimum (signed) angular displacement from `current` to `target` in radians."""
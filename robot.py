@@ -18,9 +18,12 @@ from components.hatch import Hatch
 from automations.climb import ClimbAutomation
 from components.vision import Vision
 from components.climb import Climber
+from components.localisation import Localisation
 from pyswervedrive.chassis import SwerveChassis
 from pyswervedrive.module import SwerveModule
+from utilities import motor_config
 from utilities.functions import constrain_angle, rescale_js
+from utilities.motor_cache import CachedSparkMax, CachedTalonSRX, CachedVictorSPX
 from utilities.navx import NavX
 
 ROCKET_ANGLE = 0.52  # measured field angle
@@ -62,6 +65,7 @@ class Robot(magicbot.MagicRobot):
     climber: Climber
 
     vision: Vision
+    localisation: Localisation
 
     offset_rotation_rate = 20
 
@@ -73,8 +77,8 @@ class Robot(magicbot.MagicRobot):
         y_dist = 0.2665
         self.module_a = SwerveModule(  # front right module
             "a",
-            steer_talon=ctre.TalonSRX(3),
-            drive_talon=ctre.TalonSRX(4),
+            steer_talon=CachedTalonSRX(3),
+            drive_talon=CachedTalonSRX(4),
             x_pos=x_dist,
             y_pos=y_dist,
             reverse_drive_encoder=True,
@@ -82,25 +86,37 @@ class Robot(magicbot.MagicRobot):
         )
         self.module_b = SwerveModule(  # front left module
             "b",
-            steer_talon=ctre.TalonSRX(5),
-            drive_talon=ctre.TalonSRX(6),
+            steer_talon=CachedTalonSRX(5),
+            drive_talon=CachedTalonSRX(6),
             x_pos=-x_dist,
             y_pos=y_dist,
         )
         self.module_c = SwerveModule(  # bottom left module
             "c",
-            steer_talon=ctre.TalonSRX(1),
-            drive_talon=ctre.TalonSRX(2),
+            steer_talon=CachedTalonSRX(1),
+            drive_talon=CachedTalonSRX(2),
             x_pos=-x_dist,
             y_pos=-y_dist,
         )
         self.module_d = SwerveModule(  # bottom right module
             "d",
-            steer_talon=ctre.TalonSRX(7),
-            drive_talon=ctre.TalonSRX(8),
+            steer_talon=CachedTalonSRX(7),
+            drive_talon=CachedTalonSRX(8),
             x_pos=x_dist,
             y_pos=-y_dist,
         )
+        motor_config.configure(
+            [
+                config
+                for module in (
+                    self.module_a,
+                    self.module_b,
+                    self.module_c,
+                    self.module_d,
+                )
+                for config in module.controller_configs()
+            ]
+        )
         self.imu = NavX()
 
         wpilib.SmartDashboard.putData("Gyro", self.imu.ahrs)
@@ -114,17 +130,17 @@ class Robot(magicbot.MagicRobot):
         self.hatch_left_limit_switch = wpilib.DigitalInput(8)
         self.hatch_right_limit_switch = wpilib.DigitalInput(9)
 
-        self.climber_front_motor = rev.CANSparkMax(10, rev.MotorType.kBrushless)
-        self.climber_back_motor = rev.CANSparkMax(11, rev.MotorType.kBrushless)
+        self.climber_front_motor = CachedSparkMax(10, rev.MotorType.kBrushless)
+        self.climber_back_motor = CachedSparkMax(11, rev.MotorType.kBrushless)
         self.climber_front_podium_switch = wpilib.DigitalInput(4)
         self.climber_back_podium_switch = wpilib.DigitalInput(5)
-        self.climber_drive_motor = ctre.TalonSRX(20)
+        self.climber_drive_motor = CachedTalonSRX(20)
         self.climber_pistons = wpilib.DoubleSolenoid(forwardChannel=4, reverseChannel=5)
 
         # cargo related objects
-        self.intake_motor = ctre.VictorSPX(9)
+        self.intake_motor = CachedVictorSPX(9)
         self.intake_switch = wpilib.DigitalInput(0)
-        self.arm_motor = rev.CANSparkMax(2, rev.MotorType.kBrushless)
+        self.arm_motor = CachedSparkMax(2, rev.MotorType.kBrushless)
 
         # boilerplate setup for the joystick
         self.joystick = wpilib.Joystick(0)
@@ -308,6 +324,7 @@ class Robot(magicbot.MagicRobot):
             speed = 0.1
             azimuth = math.radians(-self.gamepad.getPOV())
             for module in self.chassis.modules:
+                module.update_odometry()
                 module.set_velocity(
                     speed * math.cos(azimuth),
                     speed * math.sin(azimuth),
@@ -0,0 +1,72 @@
+import math
+
+from utilities.clock_sync import ClockSync, SimulatedCoprocessor
+
+LOOP_PERIOD = 1 / 50
+
+
+def run(clock, coprocessor, duration, start=1000.0):
+    for i in range(int(duration / LOOP_PERIOD)):
+        sent = start + i * LOOP_PERIOD
+        remote, received = coprocessor.exchange(sent)
+        clock.add_sample(sent, remote, received)
+    return received
+
+
+def test_no_samples():
+    clock = ClockSync()
+    assert clock.to_local(12.5) == 12.5
+    assert clock.confidence == 0
+
+
+def test_exact_exchange():
+    clock = ClockSync()
+    # Symmetric 1 ms delays with the remote clock 100 s behind
+    assert clock.add_sample(10.0, -89.999, 10.002)
+    assert math.isclose(clock.offset(10.001), 100)
+    assert math.isclose(clock.to_local(-89.0), 11.0)
+    assert math.isclose(clock.error, 0.001)
+    # Answers can't arrive before they were asked for
+    assert not clock.add_sample(10.0, -89.999, 9.0)
+    assert len(clock) == 1
+
+
+def test_rejects_delayed_exchanges():
+    coprocessor = SimulatedCoprocessor(
+        offset=123.4, spike_probability=0.2, loop_period=0, seed=4774
+    )
+    clock = ClockSync()
+    now = run(clock, coprocessor, 10)
+    assert abs(clock.offset(now) - coprocessor.true_offset(now)) < 1e-3
+    assert clock.confidence > 0.5
+
+    # Some of the individual exchanges are much worse
+    errors = abs(clock.samples[:, 1] - coprocessor.true_offset(now))
+    assert errors.max() > 0.01
+
+
+def test_drift():
+    coprocessor = SimulatedCoprocessor(offset=-5.0, drift=1e-4, loop_period=0, seed=1)
+    # Drift needs a long window to be seen through the jitter
+    clock = ClockSync(window=1024)
+    now = run(clock, coprocessor, 30)
+    assert math.isclose(clock.drift, -1e-4, rel_tol=0.2)
+    # Extrapolating a second ahead stays accurate
+    later = now + 1
+    remote = coprocessor.remote_time(later)
+    assert abs(clock.to_local(remote) - later) < 1e-3
+
+
+def test_confidence_falls_with_jitter():
+    steady = ClockSync()
+    run(
+        steady, SimulatedCoprocessor(offset=0, jitter=0.0005, loop_period=0, seed=2), 10
+    )
+    noisy = ClockSync()
+    run(
+        noisy,
+        SimulatedCoprocessor(offset=0, delay=0.02, jitter=0.02, loop_period=0, seed=2),
+        10,
+    )
+    assert noisy.error > steady.error
+    assert noisy.confidence < steady.confidence
@@ -0,0 +1,86 @@
+import math
+
+import numpy as np
+
+from pyswervedrive.kinematics import SwerveKinematics, desaturate, twist_to_delta
+
+POSITIONS = [(0.3, 0.2), (-0.3, 0.2), (-0.3, -0.2), (0.3, -0.2)]
+
+
+def test_matrices():
+    kinematics = SwerveKinematics(POSITIONS)
+    assert kinematics.inverse_matrix.shape == (8, 3)
+    assert kinematics.forward_matrix.shape == (3, 8)
+    assert np.allclose(kinematics.forward_matrix @ kinematics.inverse_matrix, np.eye(3))
+
+
+def test_round_trip():
+    kinematics = SwerveKinematics(POSITIONS)
+    chassis_velocity = np.array((1.0, -0.5, 2.0))
+    modules = kinematics.inverse(chassis_velocity)
+    assert modules.shape == (4, 2)
+    # Pure rotation moves the front left module backwards and to the left
+    assert np.allclose(kinematics.inverse((0, 0, 1))[0], (-0.2, 0.3))
+    assert np.allclose(kinematics.forward(modules), chassis_velocity)
+
+    speeds, angles = kinematics.inverse_polar(chassis_velocity)
+    assert np.allclose(kinematics.forward_polar(speeds, angles), chassis_velocity)
+
+
+def test_batched():
+    kinematics = SwerveKinematics(POSITIONS[:3])
+    rng = np.random.RandomState(0)
+    chassis_velocities = rng.normal(size=(50, 3))
+    speeds, angles = kinematics.inverse_polar(chassis_velocities)
+    assert speeds.shape == angles.shape == (50, 3)
+    assert np.allclose(kinematics.forward_polar(speeds, angles), chassis_velocities)
+    assert np.allclose(
+        kinematics.forward_polar(speeds[7], angles[7]), chassis_velocities[7]
+    )
+
+
+def test_desaturate():
+    kinematics = SwerveKinematics(POSITIONS)
+    modules = kinematics.inverse((3, 0, 4))
+    limited = desaturate(modules, 2)
+    speeds = np.hypot(limited[:, 0], limited[:, 1])
+    assert np.isclose(speeds.max(), 2)
+    # Still moving and turning in the same ratio, just slower
+    vx, vy, vz = kinematics.forward(limited)
+    assert np.isclose(vz / vx, 4 / 3) and np.isclose(vy, 0)
+
+    slow = kinematics.inverse((0.5, 0.5, 0))
+    assert np.array_equal(desaturate(slow, 2), slow)
+
+    batch = desaturate(np.stack((modules, slow)), 2)
+    assert np.allclose(batch, (limited, slow))
+
+
+def test_twist_to_delta():
+    assert twist_to_delta(1, 2, 0) == (1, 2)
+    # Driving forwards a quarter of the way around a circle of radius 1
+    x, y = twist_to_delta(math.pi / 2, 0, math.pi / 2)
+    assert math.isclose(x, 1) and math.isclose(y, 1)
+    # Spinning on the spot while strafing goes around a circle too
+    x, y = twist_to_delta(0, math.pi, math.pi)
+    assert math.isclose(x, -2) and abs(y) < 1e-12
+    x, y = twist_to_delta(1, 0, 1e-12)
+    assert math.isclose(x, 1) and abs(y) < 1e-9
+
+
+def test_outlier():
+    kinematics = SwerveKinematics(POSITIONS)
+    chassis_velocity = np.array((1.0, 0.5, -1.0))
+    modules = kinematics.inverse(chassis_velocity)
+    assert np.allclose(kinematics.residuals(modules, chassis_velocity), 0)
+
+    # The third wheel is spinning freely
+    modules[2] *= 3
+    fit = kinematics.forward(modules)
+    assert kinematics.residuals(modules, fit).max() > 0.3
+    outlier = kinematics.outlier(modules)
+    assert outlier == 2
+    robust = kinematics.forward_matrices_excluding[outlier] @ modules.reshape(-1)
+    assert np.allclose(robust, chassis_velocity)
+
+    assert len(SwerveKinematics(POSITIONS[:2]).forward_matrices_excluding) == 0
@@ -0,0 +1,94 @@
+import math
+import time
+
+from components.localisation import FIELD_TARGETS, FieldTarget, Localisation
+from components.vision import Vision
+
+
+class FakeChassis:
+    def __init__(self):
+        self.odometry_x = 0.0
+        self.odometry_y = 0.0
+
+    def shift_odometry(self, dx, dy):
+        self.odometry_x += dx
+        self.odometry_y += dy
+
+
+def init_localisation(x, y, heading):
+    """Drive towards (x, y) for a second, ending facing heading."""
+    t = time.monotonic()
+    localisation = Localisation()
+    localisation.chassis = FakeChassis()
+    localisation.chassis.odometry_x = x
+    localisation.chassis.odometry_y = y
+    localisation.vision = Vision()
+    for i in range(11):
+        localisation.vision.odometry.append(
+            x - 1 + i * 0.1, y, heading, t - 1 + i * 0.1
+        )
+    localisation.time = t - 1
+    return localisation, t
+
+
+def test_field_targets():
+    names = [target.name for target in FIELD_TARGETS]
+    assert len(names) == 10
+    loading_stations = [target for target in FIELD_TARGETS if "loading" in target.name]
+    assert {target.y for target in loading_stations} == {3.4, -3.4}
+
+
+def test_match():
+    localisation = Localisation()
+    front = localisation.match(5.4, 0.35, 0.1, forwards=True)
+    assert front.name == "cargo front" and front.y == 0.3
+    # Seen through the cargo camera on the back of the robot
+    assert localisation.match(5.4, 0.35, math.pi, forwards=False) == front
+    # Facing the wrong way to see it
+    assert localisation.match(5.4, 0.35, math.pi / 2, forwards=True) is None
+    # Too far from any target
+    assert localisation.match(3.0, 0.0, 0.0, forwards=True) is None
+    # Halfway between two of the side cargo bays
+    assert localisation.match(6.9, 1.0, -math.pi / 2, forwards=True) is None
+
+
+def test_correction():
+    # The odometry has drifted 0.3 m short of the truth
+    localisation, t = init_localisation(4.2 - 0.3, 0.3, 0.0)
+    # We are 1.3 m from the front of the cargo ship
+    assert localisation.correct(t - 0.2, 1.3 + 0.2, 0.0)
+    assert isinstance(localisation.target, FieldTarget)
+    correction = localisation.chassis.odometry_x - (4.2 - 0.3)
+    assert 0.2 < correction < 0.3
+    assert localisation.chassis.odometry_y == 0.3
+    assert localisation.uncertainty < math.sqrt(Localisation.INITIAL_VARIANCE)
+
+    # The odometry since the picture moves with the correction, but not before it
+    history = localisation.vision.odometry
+    assert math.isclose(history.latest()[0], 4.2 - 0.3 + correction)
+    assert math.isclose(history.at(t - 0.5)[0], 4.2 - 0.3 - 0.5)
+
+    # Another sighting moves us closer still
+    before = localisation.chassis.odometry_x
+    assert localisation.correct(t - 0.1, 1.3 + 0.1, 0.0)
+    assert before < localisation.chassis.odometry_x < 4.2 + 1e-6
+
+
+def test_side_bay_correction():
+    # Facing the second side cargo bay from 1.2 m away, with the odometry
+    # drifted 0.2 m along the side of the cargo ship and 0.1 m away from it
+    localisation, t = init_localisation(7.15 + 0.2, 0.8 + 1.2 + 0.1, -math.pi / 2)
+    assert localisation.correct(t, 1.2, 0.0)
+    assert localisation.target.name == "cargo side 2"
+    correction = localisation.chassis.odometry_x - (7.15 + 0.2)
+    assert -0.2 < correction < 0
+
+
+def test_rejects_inconsistent_sightings():
+    localisation, t = init_localisation(4.5, 0.3, 0.0)
+    localisation.covariance *= 0.01
+    localisation.time = t
+    # Would put us 0.3 m from where the odometry is sure we are
+    assert not localisation.correct(t, 0.7, 0.0)
+    assert localisation.rejections == 1
+    assert localisation.chassis.odometry_x == 4.5
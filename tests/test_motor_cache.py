@@ -0,0 +1,27 @@
+from utilities.motor_cache import CommandCache
+
+
+def test_command_cache_skips_unchanged():
+    cache = CommandCache(tolerance=0.01, refresh_period=60)
+    assert cache.update("output", ("velocity", 1.0))
+    assert not cache.update("output", ("velocity", 1.005))
+    assert cache.update("output", ("velocity", 1.5))
+    assert cache.update("output", ("position", 1.5))
+    assert cache.update("output", ("neutral",))
+    assert not cache.update("output", ("neutral",))
+    # Kinds of command are cached separately
+    assert cache.update("neutral_mode", ("brake",))
+    assert not cache.update("neutral_mode", ("brake",))
+    assert not cache.update("output", ("neutral",))
+    assert cache.writes == 5
+    assert cache.writes_saved == 4
+
+    cache.invalidate()
+    assert cache.update("neutral_mode", ("brake",))
+
+
+def test_command_cache_refresh():
+    cache = CommandCache(refresh_period=0)
+    assert cache.update("output", (0.5,))
+    assert cache.update("output", (0.5,))
+    assert cache.writes_saved == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import utilities.path_file as path_file
+import utilities.pure_pursuit as pp
+
+LEG = (pp.Waypoint(0, 0, 0, 1), pp.Waypoint(2, 0, 0, 2), pp.Waypoint(2, 2, 1, 0))
+
+
+def test_round_trip(tmp_path):
+    cache = pp.PathCache()
+    trajectory = cache.get(LEG, 2, -1)
+    filename = str(tmp_path / "leg.path")
+    key = path_file.trajectory_key(LEG, 2, -1)
+    path_file.write_trajectory(filename, trajectory, key)
+
+    loaded = path_file.load_trajectory(filename, key)
+    assert isinstance(loaded.path, np.memmap)
+    assert np.array_equal(loaded.path, trajectory.path)
+    assert loaded.profile.ds == trajectory.profile.ds
+    for name in ("s", "v", "t"):
+        assert np.array_equal(
+            getattr(loaded.profile, name), getattr(trajectory.profile, name)
+        )
+
+    # The arrays are views straight onto the file, so must be aligned
+    assert path_file.HEADER.size % 8 == 0
+    assert loaded.path.flags.aligned
+    for name in ("s", "v", "t"):
+        assert getattr(loaded.profile, name).flags.aligned
+
+    pursuit = pp.PurePursuit(0.2, 0.25, projection=True)
+    pursuit.follow(loaded)
+    assert pursuit.find_velocity((0, 0)) != (0, 0, 0)
+
+
+def test_rejects_stale(tmp_path):
+    path_file.write_legs(str(tmp_path), [LEG], 2, -1)
+    assert path_file.load_leg(str(tmp_path), LEG, 2, -1) is not None
+    # A different acceleration limit looks for a different file
+    assert path_file.load_leg(str(tmp_path), LEG, 3, -1) is None
+
+    filename = path_file.leg_filename(str(tmp_path), LEG, 2, -1)
+    with pytest.raises(ValueError, match="stale"):
+        path_file.load_trajectory(filename, key=1)
+
+
+def test_rejects_corrupt(tmp_path):
+    path_file.write_legs(str(tmp_path), [LEG], 2, -1)
+    filename = path_file.leg_filename(str(tmp_path), LEG, 2, -1)
+    with open(filename, "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+    with pytest.raises(ValueError, match="checksum"):
+        path_file.load_trajectory(filename)
+    assert path_file.load_leg(str(tmp_path), LEG, 2, -1) is None
+
+
+def test_rejects_other_versions(tmp_path):
+    path_file.write_legs(str(tmp_path), [LEG], 2, -1)
+    filename = path_file.leg_filename(str(tmp_path), LEG, 2, -1)
+    with open(filename, "r+b") as f:
+        f.seek(8)
+        f.write(bytes((path_file.VERSION + 1,)))
+    with pytest.raises(ValueError, match="version"):
+        path_file.load_trajectory(filename)
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from utilities.pose_history import PoseHistory
+
+
+def test_wraparound():
+    history = PoseHistory(3)
+    with pytest.raises(IndexError):
+        history.latest()
+    for i in range(5):
+        history.append(i, -i, 0, i / 10)
+    assert len(history) == 3
+    assert history.latest() == (4, -4, 0, 0.4)
+    assert history.view()[:, 0].tolist() == [2, 3, 4]
+
+    history.clear()
+    assert len(history) == 0
+    assert len(history.view()) == 0
+
+
+def test_interpolation():
+    history = PoseHistory(10)
+    history.append(0, 0, 0, 1.0)
+    history.append(1, 2, 0.5, 2.0)
+    x, y, heading = history.at(1.25)
+    assert math.isclose(x, 0.25)
+    assert math.isclose(y, 0.5)
+    assert math.isclose(heading, 0.125)
+    assert history.at(2.0) == (1, 2, 0.5)
+
+    # Times outside the history are clamped
+    assert history.at(0.0) == (0, 0, 0)
+    assert history.at(3.0) == (1, 2, 0.5)
+
+
+def test_heading_wrap():
+    history = PoseHistory(10)
+    history.append(0, 0, math.pi - 0.1, 0.0)
+    history.append(0, 0, -math.pi + 0.1, 1.0)
+    # Turns the short way, through pi
+    _, _, heading = history.at(0.5)
+    assert math.isclose(abs(heading), math.pi)
+    _, _, heading = history.at(0.25)
+    assert math.isclose(heading, math.pi - 0.05)
+
+
+def test_shift():
+    history = PoseHistory(3)
+    for i in range(4):
+        history.append(i, 0, 0, i)
+    history.shift(0.5, -1, since=2)
+    assert history.view()[:, 0].tolist() == [1, 2.5, 3.5]
+    assert history.view()[:, 1].tolist() == [0, -1, -1]
+    # Both copies of each sample are moved
+    history.append(4, 0, 0, 4)
+    assert history.view()[:, 0].tolist() == [2.5, 3.5, 4]
@@ -1,4 +1,9 @@
+import math
+
+import numpy as np
+
 import utilities.pure_pursuit as pp
+from utilities.functions import constrain_angle
 
 
 def test_trapezoidal():
@@ -15,3 +20,252 @@ def test_trapezoidal():
     assert trap[1][2] == waypoints[0][2], (
         "Intermediate waypoint should have beginning speed when decelerating: %s" % trap
     )
+
+
+def test_compile_path():
+    waypoints = [
+        pp.Waypoint(0, 0, 0, 1),
+        pp.Waypoint(3, 4, 0, 2),
+        pp.Waypoint(3, 4, 1, 2),
+        pp.Waypoint(3, 0, 0, 0),
+    ]
+    path = pp.compile_path(waypoints)
+    assert path.dtype == pp.PATH_DTYPE
+    assert list(path["s"]) == [0, 5, 5, 9]
+    assert list(path["length"]) == [5, 0, 4, 0]
+    assert list(path["ux"]) == [0.6, 0, 0, 0]
+    assert list(path["uy"]) == [0.8, 0, -1, 0]
+    assert list(path["theta"]) == [0, 0, 1, 0]
+    assert list(path["v"]) == [1, 2, 2, 0]
+
+
+def follow(pursuit, position, dt=0.02, max_steps=2000):
+    """Drive an ideal holonomic robot along the pursuit's path."""
+    x, y = position
+    for _ in range(max_steps):
+        vx, vy, heading = pursuit.find_velocity((x, y))
+        if pursuit.completed_path:
+            break
+        x += vx * dt
+        y += vy * dt
+    return x, y
+
+
+def test_follow_path():
+    waypoints = [
+        pp.Waypoint(0, 0, 0, 1),
+        pp.Waypoint(2, 0, 0, 1),
+        pp.Waypoint(2, 2, 0, 1),
+    ]
+    pursuit = pp.PurePursuit(look_ahead=0.2, look_ahead_speed_modifier=0.0)
+    pursuit.build_path(waypoints)
+    x, y = follow(pursuit, (0, 0))
+    assert pursuit.completed_path
+    assert abs(x - 2) < 0.1
+    assert abs(y - 2) < 0.25
+
+
+def test_projection_ignores_sideways_drift():
+    waypoints = [pp.Waypoint(0, 0, 0, 1), pp.Waypoint(4, 0, 0, 1)]
+    pursuit = pp.PurePursuit(0.2, 0.0, projection=True)
+    pursuit.build_path(waypoints)
+
+    assert pursuit.distance_along_path((1, 0.5)) == 1
+    assert pursuit.distance_along_path((1, -0.5)) == 1
+    assert pursuit.distance_along_path((1.5, 0)) == 1.5
+    # Never move backwards along the path
+    assert pursuit.distance_along_path((0.5, 0)) == 1.5
+    assert pursuit.distance_remaining == 2.5
+
+
+def test_follow_path_projection():
+    waypoints = [
+        pp.Waypoint(0, 0, 0, 1),
+        pp.Waypoint(2, 0, 0, 1),
+        pp.Waypoint(2, 2, 0, 1),
+        pp.Waypoint(0, 2, 0, 1),
+    ]
+    pursuit = pp.PurePursuit(0.2, 0.0, projection=True, projection_window=1)
+    pursuit.build_path(waypoints)
+    x, y = follow(pursuit, (0, 0))
+    assert pursuit.completed_path
+    assert abs(x - 0) < 0.25
+    assert abs(y - 2) < 0.1
+
+
+def test_velocity_profile_limits():
+    waypoints = [
+        pp.Waypoint(0, 0, 0, 0),
+        pp.Waypoint(0.5, 0, 0, 3),
+        pp.Waypoint(4, 0, 0, 3),
+        pp.Waypoint(4.5, 0, 0, 0),
+    ]
+    profile = pp.generate_velocity_profile(waypoints, 2, -1, resolution=0.01)
+    assert profile.v[0] == 0
+    assert profile.v[-1] == 0
+    assert profile.v.max() <= 3
+    # v^2 = u^2 + 2as between every pair of samples
+    dv_squared = np.diff(np.square(profile.v))
+    assert np.all(dv_squared <= 2 * 2 * profile.ds + 1e-9)
+    assert np.all(dv_squared >= -2 * 1 * profile.ds - 1e-9)
+    assert np.all(np.diff(profile.t) > 0)
+
+
+def test_velocity_profile_short_segment():
+    # Too short to reach speed: the profile should still ramp, not jump
+    waypoints = [pp.Waypoint(0, 0, 0, 0), pp.Waypoint(1, 0, 0, 4)]
+    profile = pp.generate_velocity_profile(waypoints, 2, -2)
+    assert abs(profile.speed_at(1) - 2) < 1e-6
+    assert abs(profile.speed_at(0.25) - 1) < 1e-2
+    assert profile.speed_at(-1) == 0
+    assert profile.speed_at(5) == profile.v[-1]
+
+
+def test_velocity_profile_jerk():
+    waypoints = [pp.Waypoint(0, 0, 0, 0), pp.Waypoint(3, 0, 0, 2)]
+    unlimited = pp.generate_velocity_profile(waypoints, 2, -2)
+    limited = pp.generate_velocity_profile(waypoints, 2, -2, jerk=1)
+    assert np.all(limited.v <= unlimited.v + 1e-9)
+    assert limited.t[-1] > unlimited.t[-1]
+
+
+def test_path_cache_lru():
+    cache = pp.PathCache(maxsize=2)
+    legs = [(pp.Waypoint(0, 0, 0, 1), pp.Waypoint(i, 0, 0, 1)) for i in range(1, 4)]
+    first = cache.get(legs[0], 2, -2)
+    assert cache.get(legs[0], 2, -2) is first
+    assert cache.get(list(legs[0]), 2, -2) is first
+    assert cache.get(legs[0], 1, -2) is not first
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.get(legs[0], 2, -2)
+    cache.get(legs[1], 2, -2)
+    cache.get(legs[2], 2, -2)
+    assert len(cache) == 2
+    assert cache.get(legs[1], 2, -2) is not None
+    assert cache.hits == 4
+
+
+def test_stitch_trajectory():
+    start = pp.Waypoint(0, 0, 0, 1)
+    leg = (pp.Waypoint(2, 0, 0, 2), pp.Waypoint(2, 2, 0, 2), pp.Waypoint(4, 2, 0, 0))
+    cache = pp.PathCache()
+    stitched = cache.stitch((start,), leg, 2, -1)
+    full = pp.generate_velocity_profile((start, *leg), 2, -1)
+    expected = pp.compile_path((start, *leg))
+
+    assert np.array_equal(stitched.path, expected)
+    assert np.allclose(stitched.profile.s, full.s)
+    assert np.allclose(stitched.profile.v, full.v, atol=1e-2)
+
+    pursuit = pp.PurePursuit(0.2, 0.0, projection=True)
+    pursuit.follow(stitched)
+    x, y = follow(pursuit, (0, 0))
+    assert pursuit.completed_path
+    assert abs(x - 4) < 0.25
+    assert abs(y - 2) < 0.1
+
+    # Already at the start of the leg
+    stitched = cache.stitch((pp.Waypoint(2, 0, 0, 3),), leg, 2, -1)
+    assert stitched is cache.get(leg, 2, -1)
+
+
+def test_queue_path():
+    first = (pp.Waypoint(0, 0, 0, 1), pp.Waypoint(2, 0, 0, 0))
+    second = (pp.Waypoint(2, 0, 0, 2), pp.Waypoint(4, 0, 0, 0))
+    corner = (pp.Waypoint(2, 0, 0, 2), pp.Waypoint(2, 2, 0, 0))
+    cache = pp.PathCache()
+
+    joined = pp.join_trajectories(
+        cache.get(first, 2, -1), cache.get(second, 2, -1), 2, -1
+    )
+    assert list(joined.path["s"]) == [0, 2, 4]
+    # Straight through the junction at the cruise speed of the slower leg
+    assert joined.profile.speed_at(2) == 1
+    joined = pp.join_trajectories(
+        cache.get(first, 2, -1), cache.get(corner, 2, -1), 2, -1
+    )
+    assert joined.profile.speed_at(2) == 0
+    # A gap between the legs is bridged, and the second leg's profile is kept
+    gap = (pp.Waypoint(3, 0, 0, 2), pp.Waypoint(5, 0, 0, 0))
+    joined = pp.join_trajectories(cache.get(first, 2, -1), cache.get(gap, 2, -1), 2, -1)
+    assert list(joined.path["s"]) == [0, 2, 3, 5]
+    assert joined.profile.speed_at(2) == 1
+    assert math.isclose(joined.profile.speed_at(4), math.sqrt(2))
+
+    pursuit = pp.PurePursuit(0.2, 0.0, projection=True)
+    pursuit.follow(cache.get(first, 2, -1))
+    x, y = 0, 0
+    speeds = []
+    for _ in range(2000):
+        vx, vy, heading = pursuit.find_velocity((x, y))
+        if pursuit.completed_path:
+            break
+        if pursuit.distance_traveled > 0.5 and len(pursuit.waypoints) == 2:
+            pursuit.queue_path(cache.get(second, 2, -1), 2, -1)
+        speeds.append(math.hypot(vx, vy))
+        x += vx * 0.02
+        y += vy * 0.02
+    assert abs(x - 4) < 0.25
+    assert min(speeds[len(speeds) // 4 : -len(speeds) // 4]) > 0.5
+
+
+def test_queue_path_without_profile():
+    # Backing away along a path built without a velocity profile, as the
+    # autonomous routines do, then queueing a cached leg
+    pursuit = pp.PurePursuit(0.2, 0.0)
+    pursuit.build_path((pp.Waypoint(2, 0, 0, 1.5), pp.Waypoint(1, 0, 0, 1.5)))
+    leg = (pp.Waypoint(1, 1, 0, 2), pp.Waypoint(1, 3, 0, 0))
+    pursuit.queue_path(pp.PathCache().get(leg, 2, -1), 2, -1)
+    assert list(pursuit.waypoints["s"]) == [0, 1, 2, 4]
+    assert pursuit.profile.speed_at(0.5) == 1.5
+    assert pursuit.profile.speed_at(4) == 0
+
+
+def test_find_intersections():
+    pursuit = pp.PurePursuit(0.5, 0.0)
+    pursuit.build_path([pp.Waypoint(-1, 0.1, 0, 1), pp.Waypoint(1, 0.1, 0, 1)])
+    x, y = pursuit.find_intersections(0, (0, 0))
+    assert abs(x - math.sqrt(0.5**2 - 0.1**2)) < 1e-9
+    assert abs(y - 0.1) < 1e-9
+
+    # Relative to the robot
+    x, y = pursuit.find_intersections(0, (0.5, 0))
+    assert abs(x - math.sqrt(0.5**2 - 0.1**2)) < 1e-9
+
+    assert pursuit.find_intersections(0, (0, 1)) is None
+
+    x, y = pursuit.compute_direction((0, 1), 0, 0)
+    assert abs(math.hypot(x, y) - 1) < 1e-9
+    assert y < 0 < x
+
+
+def test_heading_profile():
+    waypoints = [
+        pp.Waypoint(0, 0, 0, 1),
+        pp.Waypoint(2, 0, math.pi / 2, 1),
+        pp.Waypoint(2, 2, -math.pi / 2 - 0.5, 1),
+    ]
+    pursuit = pp.PurePursuit(0.2, 0.0)
+    pursuit.build_path(waypoints)
+
+    heading, rate = pursuit.heading_at(1)
+    assert abs(heading - math.pi / 4) < 1e-9
+    assert abs(rate - math.pi / 4) < 1e-9
+    # Turns the short way around, through pi
+    heading, rate = pursuit.heading_at(3)
+    assert abs(heading - (math.pi - 0.25)) < 1e-9
+    assert abs(rate - (math.pi - 0.5) / 2) < 1e-9
+    heading, rate = pursuit.heading_at(5)
+    assert abs(heading - (-math.pi / 2 - 0.5)) < 1e-9
+    assert rate == 0
+
+    headings = []
+    x, y = 0.0, 0.0
+    while not pursuit.completed_path:
+        vx, vy, heading = pursuit.find_velocity((x, y))
+        headings.append(heading)
+        x += vx / 50
+        y += vy / 50
+    steps = [abs(constrain_angle(b - a)) for a, b in zip(headings, headings[1:-1])]
+    assert max(steps) < 0.1
@@ -0,0 +1,55 @@
+import numpy as np
+
+import utilities.pure_pursuit as pp
+from utilities.pursuit_sweep import simulate, sweep
+
+WAYPOINTS = (
+    pp.Waypoint(0, 0, 0, 1),
+    pp.Waypoint(2, 0, 0, 2),
+    pp.Waypoint(2, 2, 0, 2),
+    pp.Waypoint(0, 2, 0, 1),
+)
+
+
+def trajectory():
+    return pp.PathCache().get(WAYPOINTS, 2, -2)
+
+
+def test_simulate_matches_pure_pursuit():
+    traj = trajectory()
+    result = simulate(traj, [0.2], [0.25], [0], noise=0.0)
+
+    pursuit = pp.PurePursuit(0.2, 0.25, projection=True)
+    pursuit.follow(traj)
+    x, y = 0.0, 0.0
+    for step in range(1000):
+        vx, vy, _ = pursuit.find_velocity((x, y))
+        if pursuit.completed_path:
+            break
+        x += vx / 50
+        y += vy / 50
+
+    assert abs(result.completion_time[0] - step / 50) < 1e-9
+    assert result.max_cross_track_error[0] < 0.5
+
+
+def test_sweep():
+    result = sweep(trajectory(), [0.1, 0.2, 0.4], [0, 0.25], seeds=[1, 2], chunk_size=5)
+    assert len(result.completion_time) == 12
+    assert not np.isnan(result.completion_time).any()
+    assert np.all(result.rms_cross_track_error <= result.max_cross_track_error)
+    # A larger lookahead cuts corners more
+    assert result.max_cross_track_error[-1] > result.max_cross_track_error[0]
+
+    # The same seed gives the same result
+    again = sweep(trajectory(), [0.1], [0], seeds=[1])
+    assert again.completion_time[0] == result.completion_time[0]
+    assert again.max_cross_track_error[0] == result.max_cross_track_error[0]
+
+
+def test_sweep_processes():
+    serial = sweep(trajectory(), [0.2, 0.3], [0.25], seeds=[3], chunk_size=1)
+    parallel = sweep(
+        trajectory(), [0.2, 0.3], [0.25], seeds=[3], chunk_size=1, processes=2
+    )
+    assert np.array_equal(serial.completion_time, parallel.completion_time)
@@ -0,0 +1,37 @@
+import math
+
+from utilities.pure_pursuit import Waypoint
+from utilities.spline import hermite_path
+
+
+def test_hermite_path_endpoints():
+    waypoints = [Waypoint(0, 0, 0, 1), Waypoint(2, 2, math.pi / 2, 1)]
+    path = hermite_path(waypoints, lateral_acceleration=100)
+    assert path[0] == waypoints[0]
+    assert path[-1] == waypoints[-1]
+    assert all(abs(a.x - b.x) < 0.1 for a, b in zip(path, path[1:]))
+
+    # Leaves the start along its heading
+    assert abs(path[1].y) < 1e-3
+    assert path[1].x > 0
+
+
+def test_hermite_path_straight():
+    waypoints = [Waypoint(0, 0, 0, 2), Waypoint(3, 0, 0, 2)]
+    path = hermite_path(waypoints, lateral_acceleration=1)
+    assert all(abs(p.y) < 1e-9 for p in path)
+    assert all(p.v == 2 for p in path)
+
+
+def test_hermite_path_curvature_limit():
+    waypoints = [Waypoint(0, 0, 0, 3), Waypoint(1, 1, math.pi / 2, 3)]
+    path = hermite_path(waypoints, lateral_acceleration=1, resolution=0.01)
+    assert min(p.v for p in path) < 1.5
+    for a, b, c in zip(path, path[1:], path[2:-1]):
+        # Curvature from the circle through three consecutive samples
+        ab = math.hypot(b.x - a.x, b.y - a.y)
+        bc = math.hypot(c.x - b.x, c.y - b.y)
+        ca = math.hypot(a.x - c.x, a.y - c.y)
+        area = abs((b.x - a.x) * (c.y - a.y) - (c.x - a.x) * (b.y - a.y)) / 2
+        curvature = 4 * area / (ab * bc * ca)
+        assert b.v ** 2 * curvature < 1.1
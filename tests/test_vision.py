@@ -1,9 +1,12 @@
-from components.vision import Odometry, Vision
+from components.vision import TargetTracker, Vision
+from pyswervedrive.chassis import Pose
 from utilities.functions import rotate_vector
 
 import math
 import time
 
+import numpy as np
+
 
 class FakeImu:
     def __init__(self):
@@ -19,30 +22,53 @@ class FakeChassis:
         self.odometry_y = 0.0
         self.imu = FakeImu()
 
+    @property
+    def pose(self):
+        return Pose(
+            self.odometry_x,
+            self.odometry_y,
+            self.imu.getAngle(),
+            0.0,
+            0.0,
+            0.0,
+            time.monotonic(),
+        )
+
 
-def init_vision(heading=0.0):
+def init_vision(heading=0.0, current_heading=None):
     t = time.monotonic()
     v = Vision()
     v.chassis = FakeChassis()
     # Inject some fake odometry
-    v.odometry.appendleft(Odometry(0, 0, heading, t - 0.3))
-    v.odometry.appendleft(Odometry(1, 1, heading, t - 0.2))
-    v.odometry.appendleft(Odometry(2, 2, heading, t - 0.1))
-    v.odometry.appendleft(Odometry(3, 3, heading, t))
+    v.odometry.append(0, 0, heading, t - 0.3)
+    v.odometry.append(1, 1, heading, t - 0.2)
+    v.odometry.append(2, 2, heading, t - 0.1)
+    if current_heading is None:
+        current_heading = heading
+    v.odometry.append(3, 3, current_heading, t)
     return v, t
 
 
-def test_odom_deque_order():
+def test_odom_history_order():
     v = Vision()
     v.chassis = FakeChassis()
     for i in range(5):
         time.sleep(0.05)
         v.execute()
-    assert len(v.odometry) > 0
-    newer_odom = v.odometry.popleft()
-    for odom in v.odometry:
-        assert newer_odom.t > odom.t
-        newer_odom = odom
+    assert len(v.odometry) == 5
+    times = v.odometry.view()[:, 3]
+    assert all(times[1:] > times[:-1])
+
+
+def test_stale_odometry_not_stored():
+    v = Vision()
+    v.chassis = FakeChassis()
+    pose = v.chassis.pose
+    v.chassis = type("StaleChassis", (), {"pose": pose})()
+    for i in range(3):
+        v.execute()
+    assert len(v.odometry) == 1
+    assert v.odometry.latest()[3] == pose.t
 
 
 def test_get_pose_delta():
@@ -68,21 +94,27 @@ def test_get_fiducial_position():
     v.fiducial_y_entry.setDouble(0.5)
 
     v.fiducial_time_entry.setDouble(t)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
     assert x == 5.0
     assert y == 0.5
     assert heading == 0.0
 
+    # Between odometry samples, the pose is interpolated
     v.fiducial_time_entry.setDouble(t - 0.15)
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
-    assert x == 4.0
-    assert y == -0.5
+    assert abs(x - 3.5) < 1e-6
+    assert abs(y - -1.0) < 1e-6
     assert heading == 0.0
 
     v.fiducial_time_entry.setDouble(t - 0.25)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
-    assert x == 3.0
-    assert y == -1.5
+    assert abs(x - 2.5) < 1e-6
+    assert abs(y - -2.0) < 1e-6
     assert heading == 0.0
 
 
@@ -94,45 +126,132 @@ def test_get_fiducial_position_rotated():
     v.fiducial_y_entry.setDouble(0.5)
 
     v.fiducial_time_entry.setDouble(t)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
     assert x == 5.0
     assert y == 0.5
     assert heading == 0.0
 
     v.fiducial_time_entry.setDouble(t - 0.15)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
-    assert x == 4.0
-    assert y == 1.5
+    assert abs(x - 3.5) < 1e-6
+    assert abs(y - 2.0) < 1e-6
     assert heading == 0.0
 
     v.fiducial_time_entry.setDouble(t - 0.25)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
-    assert x == 3.0
-    assert y == 2.5
+    assert abs(x - 2.5) < 1e-6
+    assert abs(y - 3.0) < 1e-6
     assert heading == 0.0
 
 
 def test_odometry_rotation():
-    v, t = init_vision()
+    v, t = init_vision(current_heading=math.pi / 2)
     v.chassis.imu.heading = math.pi / 2
-    odom = v.odometry.popleft()
-    v.odometry.appendleft(Odometry(odom.x, odom.y, math.pi / 2, odom.t))
 
     v.fiducial_x_entry.setDouble(5.0)
     v.fiducial_y_entry.setDouble(0.5)
 
     v.fiducial_time_entry.setDouble(t)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
     assert x == 5.0
     assert y == 0.5
     assert heading == 0.0
 
     v.fiducial_time_entry.setDouble(t - 0.15)
+
+    v.read_frame()
     x, y, heading = v.get_fiducial_position()
-    assert x == 4.0
-    assert y == -0.5
+    assert abs(x - 3.5) < 1e-6
+    assert abs(y - -1.0) < 1e-6
     assert heading == math.pi / 2
 
     rot_x, rot_y = rotate_vector(x, y, -heading)
-    assert abs(rot_x - -0.5) < 1e-4
-    assert abs(rot_y - -4) < 1e-4
+    assert abs(rot_x - -1.0) < 1e-4
+    assert abs(rot_y - -3.5) < 1e-4
+
+
+def test_read_frame():
+    v, t = init_vision()
+    v.fiducial_x_entry.setDouble(5.0)
+    v.fiducial_time_entry.setDouble(t)
+    frame = v.read_frame()
+    assert frame.seq == 1
+    assert v.fiducial_x == 5.0
+
+    # Later updates are not seen until the next frame is read
+    v.fiducial_x_entry.setDouble(2.0)
+    assert v.fiducial_x == 5.0
+    assert v.read_frame().seq == 2
+    assert v.fiducial_x == 2.0
+
+
+def test_target_tracker():
+    tracker = TargetTracker()
+    tracker.predict(1.0)
+    assert tracker.update(5.0, 1.0, 5.0)
+    first_uncertainty = tracker.uncertainty
+    # Noisy measurements average out, and the estimate gets more certain
+    for i, noise in enumerate((0.05, -0.05, 0.03, -0.03)):
+        tracker.predict(1.0 + (i + 1) * 0.1)
+        assert tracker.update(5.0 + noise, 1.0 - noise, 5.0)
+    assert abs(tracker.position[0] - 5.0) < 0.02
+    assert abs(tracker.position[1] - 1.0) < 0.02
+    assert tracker.uncertainty < first_uncertainty
+
+    # Between measurements, the estimate follows the robot
+    x, y = tracker.relative_to(4.0, 1.0, math.pi / 2)
+    assert abs(x - 0.0) < 0.02
+    assert abs(y - -1.0) < 0.02
+
+    # Without measurements, the estimate becomes less certain
+    uncertainty = tracker.uncertainty
+    tracker.predict(3.0)
+    assert tracker.uncertainty > uncertainty
+
+
+def test_target_tracker_outliers():
+    tracker = TargetTracker()
+    for i in range(5):
+        tracker.predict(i * 0.1)
+        tracker.update(2.0, 0.0, 2.0)
+    assert not tracker.update(2.0, 1.5, 2.0)
+    assert abs(tracker.position[1]) < 1e-6
+
+    # The target has changed, so start tracking the new one
+    for i in range(TargetTracker.MAX_REJECTIONS - 1):
+        assert not tracker.update(2.0, 1.5, 2.0)
+    assert not tracker.tracking
+    assert tracker.update(2.0, 1.5, 2.0)
+    assert tracker.position[1] == 1.5
+
+
+def test_tracker_fuses_fiducials():
+    v, t = init_vision()
+    v.chassis.odometry_x = 3.0
+    v.chassis.odometry_y = 3.0
+    assert not v.target_tracked
+
+    v.fiducial_x_entry.setDouble(2.0)
+    v.fiducial_y_entry.setDouble(0.5)
+    v.fiducial_time_entry.setDouble(t - 0.05)
+    v.read_frame()
+    v.update_tracker()
+    assert v.target_tracked
+    # Seen from (2.5, 2.5), so the target is at (4.5, 3) on the field
+    assert np.allclose(v.tracker.position, (4.5, 3.0))
+    x, y = v.get_target_position()
+    assert abs(x - 1.5) < 1e-6
+    assert abs(y - 0.0) < 1e-6
+
+    # The same frame is only fused once
+    last_update = v.tracker.last_update
+    v.update_tracker()
+    assert v.tracker.last_update == last_update
@@ -0,0 +1,183 @@
+"""Estimation of the offset between our clock and the vision coprocessor's.
+
+Each ping/pong exchange gives a measurement of the offset, in the style of
+NTP: if a ping is sent at local time t0, answered at remote time t1 and the
+answer is seen at local time t3, the offset is (t0 + t3) / 2 - t1, to within
+half the round trip time t3 - t0. Exchanges that were delayed on the way out
+or back are off by up to half of that delay, so only the exchanges with the
+smallest round trip times are trusted, and a line is fitted through them to
+follow any drift between the clocks.
+"""
+
+import math
+import random
+from typing import Tuple
+
+import numpy as np
+
+MIDPOINT, OFFSET, RTT = range(3)
+
+
+class ClockSync:
+    """Tracks the offset of the local clock from a remote clock."""
+
+    #: Largest drift between the clocks that will be believed, in seconds per
+    #: second. Real crystals are well within this.
+    MAX_DRIFT = 2e-4
+    #: Don't estimate drift from samples spread over less time than this
+    MIN_DRIFT_SPAN = 4  # seconds
+    #: The error bound, in seconds, at which confidence has dropped to 1/e
+    CONFIDENCE_SCALE = 0.01
+
+    def __init__(self, window: int = 256, best_fraction: float = 0.25) -> None:
+        """
+        Args:
+            window: how many of the most recent exchanges to keep.
+            best_fraction: the fraction of the window, by round trip time,
+                used for the estimate.
+        """
+        self.window = window
+        self.best_fraction = best_fraction
+        self.samples = np.zeros((window, 3))
+        self.count = 0
+
+        #: The local time the offset estimate is referenced to
+        self.reference_time = 0.0
+        #: The offset (local - remote) at the reference time
+        self.base_offset = 0.0
+        self.drift = 0.0
+        #: Bound on the error of the offset estimate, in seconds
+        self.error = math.inf
+        #: How much the estimate can be trusted, from 0 to 1
+        self.confidence = 0.0
+
+    def __len__(self) -> int:
+        return min(self.count, self.window)
+
+    def add_sample(self, sent: float, remote: float, received: float) -> bool:
+        """Add a ping/pong exchange and update the estimate.
+
+        Args:
+            sent: local time the ping was sent.
+            remote: remote time the ping was answered.
+            received: local time the answer was seen.
+
+        Returns:
+            False if the exchange was impossible and was discarded.
+        """
+        rtt = received - sent
+        if rtt < 0:
+            return False
+        self.samples[self.count % self.window] = (
+            (sent + received) / 2,
+            (sent + received) / 2 - remote,
+            rtt,
+        )
+        self.count += 1
+        self.update()
+        return True
+
+    def update(self) -> None:
+        """Recompute the estimate from the stored exchanges."""
+        samples = self.samples[: len(self)]
+        best_count = max(1, math.ceil(len(samples) * self.best_fraction))
+        if best_count < len(samples):
+            best = np.argpartition(samples[:, RTT], best_count - 1)[:best_count]
+            samples = samples[best]
+
+        times = samples[:, MIDPOINT]
+        offsets = samples[:, OFFSET]
+        self.reference_time = times.mean()
+        self.base_offset = offsets.mean()
+        if times.max() - times.min() >= self.MIN_DRIFT_SPAN:
+            centred = times - self.reference_time
+            drift = np.dot(centred, offsets - self.base_offset) / np.dot(
+                centred, centred
+            )
+            self.drift = max(min(drift, self.MAX_DRIFT), -self.MAX_DRIFT)
+        else:
+            self.drift = 0.0
+
+        residuals = (
+            offsets - self.base_offset - self.drift * (times - self.reference_time)
+        )
+        self.error = samples[:, RTT].min() / 2 + residuals.std()
+        filled = len(self) / self.window
+        self.confidence = filled * math.exp(-self.error / self.CONFIDENCE_SCALE)
+
+    def offset(self, local_time: float) -> float:
+        """The offset (local - remote) of the clocks at a local time."""
+        return self.base_offset + self.drift * (local_time - self.reference_time)
+
+    def to_local(self, remote_time: float) -> float:
+        """Convert a time on the remote clock to the local clock."""
+        # Solve local = remote + offset(local) for local
+        offset_at_zero = self.base_offset - self.drift * self.reference_time
+        return (remote_time + offset_at_zero) / (1 - self.drift)
+
+
+class SimulatedCoprocessor:
+    """A stand-in for the coprocessor's end of the ping/pong exchange.
+
+    Its clock runs offset from, and optionally drifting against, the local
+    clock, and each message is delayed by a random amount, occasionally by a
+    lot. Answers can be made to be seen only at the next control loop
+    iteration, as they would be if they were polled from NetworkTables.
+    """
+
+    def __init__(
+        self,
+        offset: float,
+        drift: float = 0.0,
+        delay: float = 0.002,
+        jitter: float = 0.002,
+        spike_probability: float = 0.05,
+        spike_delay: float = 0.05,
+        loop_period: float = 1 / 50,
+        seed=None,
+    ) -> None:
+        """
+        Args:
+            offset: local - remote clock offset at local time 0.
+            drift: how much faster the remote clock runs, in seconds per second.
+            delay: the minimum one way delay.
+            jitter: the mean of the random extra one way delay.
+            spike_probability: chance of a message being badly delayed.
+            spike_delay: the mean extra delay of a badly delayed message.
+            loop_period: how often the local end reads the answers, or 0 if
+                they are timestamped as soon as they arrive.
+        """
+        self.initial_offset = offset
+        self.drift = drift
+        self.delay = delay
+        self.jitter = jitter
+        self.spike_probability = spike_probability
+        self.spike_delay = spike_delay
+        self.loop_period = loop_period
+        self.rng = random.Random(seed)
+
+    def remote_time(self, local_time: float) -> float:
+        return local_time * (1 + self.drift) - self.initial_offset
+
+    def true_offset(self, local_time: float) -> float:
+        """The actual offset (local - remote) at a local time."""
+        return local_time - self.remote_time(local_time)
+
+    def one_way_delay(self) -> float:
+        delay = self.delay + self.rng.expovariate(1 / self.jitter)
+        if self.rng.random() < self.spike_probability:
+            delay += self.rng.expovariate(1 / self.spike_delay)
+        return delay
+
+    def exchange(self, sent: float) -> Tuple[float, float]:
+        """Send a ping at a local time.
+
+        Returns:
+            The remote time the ping was answered, and the local time the
+            answer was seen.
+        """
+        answered = sent + self.one_way_delay()
+        arrived = answered + self.one_way_delay()
+        if self.loop_period:
+            arrived = math.ceil(arrived / self.loop_period) * self.loop_period
+        return self.remote_time(answered), arrived
@@ -0,0 +1,144 @@
+"""Motor controllers that skip writing commands that have not changed.
+
+Every command sent to a motor controller is a CAN frame, and with this many
+controllers on the bus, sending the same command every loop adds up. These
+wrappers remember the last command of each kind and only pass a new one
+through when it differs, or when the last write is old enough that it should
+be refreshed in case the controller missed it.
+"""
+
+import numbers
+import time
+from typing import Dict, Tuple
+
+import ctre
+import rev
+
+DEFAULT_TOLERANCE = 1e-4
+DEFAULT_REFRESH_PERIOD = 0.25  # seconds
+
+
+class CommandCache:
+    """The last command of each kind sent to a motor controller."""
+
+    __slots__ = ("tolerance", "refresh_period", "last", "writes", "writes_saved")
+
+    def __init__(
+        self,
+        tolerance: float = DEFAULT_TOLERANCE,
+        refresh_period: float = DEFAULT_REFRESH_PERIOD,
+    ) -> None:
+        """
+        Args:
+            tolerance: how far a numeric argument may change before the
+                command is sent again.
+            refresh_period: resend an unchanged command after this long, in
+                seconds.
+        """
+        self.tolerance = tolerance
+        self.refresh_period = refresh_period
+        self.last: Dict[str, Tuple[tuple, float]] = {}
+        self.writes = 0
+        self.writes_saved = 0
+
+    def update(self, kind: str, command: tuple) -> bool:
+        """Record a command, and decide whether it needs to be written.
+
+        Args:
+            kind: which kind of command this is. Only the last command of
+                each kind is remembered.
+            command: the arguments of the command.
+
+        Returns:
+            True if the command should be sent to the controller.
+        """
+        now = time.monotonic()
+        last = self.last.get(kind)
+        if (
+            last is not None
+            and now - last[1] < self.refresh_period
+            and self.matches(last[0], command)
+        ):
+            self.writes_saved += 1
+            return False
+        self.last[kind] = command, now
+        self.writes += 1
+        return True
+
+    def matches(self, a: tuple, b: tuple) -> bool:
+        """Whether two commands are the same, to within the tolerance."""
+        if len(a) != len(b):
+            return False
+        for x, y in zip(a, b):
+            if x == y:
+                continue
+            if not (isinstance(x, numbers.Real) and isinstance(y, numbers.Real)):
+                return False
+            if abs(x - y) > self.tolerance:
+                return False
+        return True
+
+    def invalidate(self) -> None:
+        """Forget every command, so the next of each kind is always written."""
+        self.last.clear()
+
+
+class CachedCTREMotor:
+    """Command caching for CTRE motor controllers. Use via a subclass."""
+
+    def __init__(
+        self,
+        deviceNumber: int,
+        *,
+        tolerance: float = DEFAULT_TOLERANCE,
+        refresh_period: float = DEFAULT_REFRESH_PERIOD,
+    ) -> None:
+        super().__init__(deviceNumber)
+        self.command_cache = CommandCache(tolerance, refresh_period)
+
+    def set(self, mode: ctre.ControlMode, demand0: float, *args) -> None:
+        if self.command_cache.update("output", (mode, demand0, *args)):
+            super().set(mode, demand0, *args)
+
+    def neutralOutput(self) -> None:
+        if self.command_cache.update("output", ("neutral",)):
+            super().neutralOutput()
+
+    def setNeutralMode(self, neutralMode: ctre.NeutralMode) -> None:
+        if self.command_cache.update("neutral_mode", (neutralMode,)):
+            super().setNeutralMode(neutralMode)
+
+
+class CachedTalonSRX(CachedCTREMotor, ctre.TalonSRX):
+    """A TalonSRX that skips writing unchanged commands."""
+
+
+class CachedVictorSPX(CachedCTREMotor, ctre.VictorSPX):
+    """A VictorSPX that skips writing unchanged commands."""
+
+
+class CachedSparkMax(rev.CANSparkMax):
+    """A CANSparkMax that skips writing unchanged commands."""
+
+    def __init__(
+        self,
+        deviceID: int,
+        type: rev.MotorType,
+        *,
+        tolerance: float = DEFAULT_TOLERANCE,
+        refresh_period: float = DEFAULT_REFRESH_PERIOD,
+    ) -> None:
+        super().__init__(deviceID, type)
+        self.command_cache = CommandCache(tolerance, refresh_period)
+
+    def set(self, speed: float) -> None:
+        if self.command_cache.update("output", (float(speed),)):
+            super().set(speed)
+
+    def disable(self) -> None:
+        if self.command_cache.update("output", ("disabled",)):
+            super().disable()
+
+    def setIdleMode(self, mode: rev.IdleMode) -> None:
+        if self.command_cache.update("idle_mode", (mode,)):
+            super().setIdleMode(mode)
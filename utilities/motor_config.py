@@ -0,0 +1,113 @@
+"""Fast, declarative configuration of CTRE motor controllers.
+
+Each config* call with a timeout blocks until the controller acknowledges it,
+which adds up to seconds of startup time across every controller on the
+robot. Instead, a controller's configuration is described as a mapping of
+parameters to values. Only the parameters that differ from what is already
+on the controller are written, without waiting for acknowledgement, and
+the parameters that were written are checked in a single verification pass
+at the end.
+"""
+
+import contextlib
+import logging
+import math
+import time
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import ctre
+
+#: Maps (parameter, ordinal) to the value it should have. The ordinal is the
+#: PID slot for per-slot parameters, and 0 otherwise.
+Config = Dict[Tuple[ctre.ParamEnum, int], float]
+
+READ_TIMEOUT = 10  # ms
+WRITE_TIMEOUT = 10  # ms, for rewriting parameters that failed verification
+
+logger = logging.getLogger("motor_config")
+
+
+def matches(current: float, value: float) -> bool:
+    """Whether a parameter read back from a controller has the given value.
+
+    Controllers store parameters in fixed point, so they rarely read back
+    exactly as written.
+    """
+    return math.isclose(current, value, rel_tol=1e-2, abs_tol=1e-3)
+
+
+def write_config(motor: ctre.TalonSRX, config: Config) -> Config:
+    """Write the parameters of a config that differ from those on a controller.
+
+    The writes do not wait for the controller to acknowledge them, see
+    verify_config.
+
+    Returns:
+        The parameters that were written.
+    """
+    written = {}
+    for (param, ordinal), value in config.items():
+        current = motor.configGetParameter(param, ordinal, READ_TIMEOUT)
+        if not matches(current, value):
+            motor.configSetParameter(param, value, 0, ordinal, 0)
+            written[param, ordinal] = value
+    return written
+
+
+def verify_config(motor: ctre.TalonSRX, config: Config) -> List[str]:
+    """Check a config was applied, rewriting (and waiting for) any parameters
+    that were not. Only pass the parameters that were written, as each is
+    read back with a blocking call.
+
+    Returns:
+        The names of the parameters that had to be rewritten.
+    """
+    failed = []
+    for (param, ordinal), value in config.items():
+        current = motor.configGetParameter(param, ordinal, READ_TIMEOUT)
+        if not matches(current, value):
+            motor.configSetParameter(param, value, 0, ordinal, WRITE_TIMEOUT)
+            failed.append(f"{param.name}[{ordinal}]")
+    return failed
+
+
+def configure(controllers: Sequence[Tuple[str, ctre.TalonSRX, Config]]) -> None:
+    """Apply configs to many controllers, logging how long each takes.
+
+    Args:
+        controllers: the name, controller and config of each controller.
+    """
+    start = time.monotonic()
+    written = []
+    for name, motor, config in controllers:
+        device_start = time.monotonic()
+        written.append(write_config(motor, config))
+        logger.info(
+            "%s: wrote %d of %d parameters in %.1f ms",
+            name,
+            len(written[-1]),
+            len(config),
+            (time.monotonic() - device_start) * 1000,
+        )
+
+    verify_start = time.monotonic()
+    for (name, motor, _), config in zip(controllers, written):
+        failed = verify_config(motor, config)
+        if failed:
+            logger.warning("%s: rewrote %s", name, ", ".join(failed))
+    end = time.monotonic()
+    logger.info(
+        "configured %d controllers in %.1f ms (verification took %.1f ms)",
+        len(controllers),
+        (end - start) * 1000,
+        (end - verify_start) * 1000,
+    )
+
+
+@contextlib.contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Log how long it takes to configure a controller that is configured
+    by hand, rather than through configure."""
+    start = time.monotonic()
+    yield
+    logger.info("%s: configured in %.1f ms", name, (time.monotonic() - start) * 1000)
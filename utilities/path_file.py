@@ -0,0 +1,169 @@
+"""A compact binary file format for precompiled trajectories.
+
+Trajectories are generated offline and loaded on the robot by memory-mapping
+the file, so the path and profile arrays are views onto the file rather than
+copies in memory.
+
+A file is a fixed header followed by little-endian float64 data: the path
+rows (see PATH_DTYPE), then the profile spacing and its s, v and t samples.
+The header holds a format version, a key identifying the waypoints and limits
+the trajectory was generated from, and a CRC-32 of the data. The header is a
+multiple of 8 bytes long, so the float64 arrays are aligned in the file.
+
+The CRC is checked when a file is loaded, so a file damaged on disk or while
+being deployed is rejected. The files are only a few kilobytes, so this is
+cheap.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import zlib
+from typing import Optional, Sequence
+
+import numpy as np
+
+from utilities.pure_pursuit import (
+    PATH_DTYPE,
+    Trajectory,
+    VelocityProfile,
+    Waypoint,
+    compile_path,
+    generate_velocity_profile,
+)
+
+MAGIC = b"DBPATH\0\0"
+VERSION = 2
+#: magic, version, path rows, profile samples, key, checksum (padded to 40 bytes)
+HEADER = struct.Struct("<8sIIIQI8x")
+SUFFIX = ".path"
+
+logger = logging.getLogger("path_file")
+
+
+def trajectory_key(
+    waypoints: Sequence[Waypoint],
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+) -> int:
+    """A stable 64 bit key for the inputs a trajectory was generated from."""
+    data = np.array(waypoints, dtype="<f8").tobytes()
+    limits = (acceleration, deceleration, np.nan if jerk is None else jerk)
+    data += np.array(limits, dtype="<f8").tobytes()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def write_trajectory(filename: str, trajectory: Trajectory, key: int = 0) -> None:
+    """Write a trajectory to a file."""
+    path, profile = trajectory
+    payload = b"".join(
+        (
+            np.ascontiguousarray(path, dtype=PATH_DTYPE.newbyteorder("<")).tobytes(),
+            np.array((profile.ds,), dtype="<f8").tobytes(),
+            np.array((profile.s, profile.v, profile.t), dtype="<f8").tobytes(),
+        )
+    )
+    header = HEADER.pack(
+        MAGIC, VERSION, len(path), len(profile.s), key, zlib.crc32(payload)
+    )
+    with open(filename, "wb") as f:
+        f.write(header)
+        f.write(payload)
+
+
+def load_trajectory(
+    filename: str, key: Optional[int] = None, verify: bool = True
+) -> Trajectory:
+    """Memory-map a trajectory from a file.
+
+    Args:
+        filename: the file to load.
+        key: if given, the key the trajectory must have been written with.
+        verify: check the data against the checksum in the header.
+
+    Raises:
+        ValueError: if the file is malformed, from another version of the
+            format, stale, or corrupt.
+    """
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    if len(data) < HEADER.size:
+        raise ValueError(f"{filename}: too short for a path file")
+    magic, version, rows, samples, file_key, checksum = HEADER.unpack(
+        data[: HEADER.size].tobytes()
+    )
+    if magic != MAGIC:
+        raise ValueError(f"{filename}: not a path file")
+    if version != VERSION:
+        raise ValueError(f"{filename}: format version {version}, expected {VERSION}")
+    if key is not None and file_key != key:
+        raise ValueError(f"{filename}: stale, generated from different waypoints")
+
+    path_size = rows * PATH_DTYPE.itemsize
+    expected_size = HEADER.size + path_size + (1 + 3 * samples) * 8
+    if len(data) != expected_size:
+        raise ValueError(
+            f"{filename}: expected {expected_size} bytes, found {len(data)}"
+        )
+    payload = data[HEADER.size :]
+    if verify and zlib.crc32(payload) != checksum:
+        raise ValueError(f"{filename}: checksum mismatch")
+
+    path = payload[:path_size].view(PATH_DTYPE.newbyteorder("<"))
+    floats = payload[path_size:].view("<f8")
+    s, v, t = floats[1:].reshape(3, samples)
+    return Trajectory(path, VelocityProfile(floats.item(0), s, v, t))
+
+
+def leg_filename(
+    directory: str,
+    waypoints: Sequence[Waypoint],
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+) -> str:
+    """The file a leg is stored in, named by its key."""
+    key = trajectory_key(waypoints, acceleration, deceleration, jerk)
+    return os.path.join(directory, f"{key:016x}{SUFFIX}")
+
+
+def write_legs(
+    directory: str,
+    legs: Sequence[Sequence[Waypoint]],
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+) -> None:
+    """Generate and write out trajectories for several legs."""
+    os.makedirs(directory, exist_ok=True)
+    for leg in legs:
+        profile = generate_velocity_profile(leg, acceleration, deceleration, jerk)
+        trajectory = Trajectory(compile_path(leg), profile)
+        key = trajectory_key(leg, acceleration, deceleration, jerk)
+        filename = leg_filename(directory, leg, acceleration, deceleration, jerk)
+        write_trajectory(filename, trajectory, key)
+        # Check what was written, so the robot doesn't have to
+        load_trajectory(filename, key)
+
+
+def load_leg(
+    directory: str,
+    waypoints: Sequence[Waypoint],
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+) -> Optional[Trajectory]:
+    """Load the trajectory for a leg if it was generated ahead of time.
+
+    Returns None if there is no usable file for the leg.
+    """
+    filename = leg_filename(directory, waypoints, acceleration, deceleration, jerk)
+    key = trajectory_key(waypoints, acceleration, deceleration, jerk)
+    try:
+        return load_trajectory(filename, key)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning("rejecting path file: %s", e)
+        return None
@@ -0,0 +1,87 @@
+"""A fixed-size history of robot poses, for looking up where the robot was."""
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+from utilities.functions import constrain_angle
+
+X, Y, HEADING, T = range(4)
+
+
+class PoseHistory:
+    """A ring buffer of timestamped poses.
+
+    Every sample is written twice, capacity rows apart, so the most recent
+    samples are always a contiguous slice of the buffer and can be searched
+    without copying.
+    """
+
+    __slots__ = ("capacity", "data", "count")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, 4))
+        #: Total number of samples ever appended
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, x: float, y: float, heading: float, t: float) -> None:
+        """Add a pose. Samples must be appended in time order."""
+        i = self.count % self.capacity
+        self.data[i] = self.data[i + self.capacity] = x, y, heading, t
+        self.count += 1
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def shift(self, dx: float, dy: float, since: float = -math.inf) -> None:
+        """Move the positions of the samples from a time onwards."""
+        moved = self.data[:, T] >= since
+        self.data[moved, X] += dx
+        self.data[moved, Y] += dy
+
+    def view(self) -> np.ndarray:
+        """The stored samples, oldest first, as an (n, 4) array of x, y,
+        heading and t. This is a view into the buffer, so don't keep it."""
+        if self.count <= self.capacity:
+            return self.data[: self.count]
+        start = self.count % self.capacity
+        return self.data[start : start + self.capacity]
+
+    def latest(self) -> Tuple[float, float, float, float]:
+        """The most recent sample."""
+        if not self.count:
+            raise IndexError("no poses in history")
+        return tuple(self.data[(self.count - 1) % self.capacity].tolist())
+
+    def at(self, t: float) -> Tuple[float, float, float]:
+        """Find the pose at a time, interpolating between samples.
+
+        Times outside of the history are clamped to the oldest or newest
+        sample.
+
+        Returns:
+            The x, y and heading of the robot at the time.
+        """
+        samples = self.view()
+        if not len(samples):
+            raise IndexError("no poses in history")
+        times = samples[:, T]
+        i = int(np.searchsorted(times, t))
+        if i == 0:
+            return tuple(samples[0, :T].tolist())
+        if i == len(samples):
+            return tuple(samples[-1, :T].tolist())
+        x0, y0, heading0, t0 = samples[i - 1].tolist()
+        x1, y1, heading1, t1 = samples[i].tolist()
+        portion = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        heading = heading0 + constrain_angle(heading1 - heading0) * portion
+        return (
+            x0 + (x1 - x0) * portion,
+            y0 + (y1 - y0) * portion,
+            constrain_angle(heading),
+        )
@@ -1,8 +1,11 @@
 import math
+from collections import OrderedDict
 from typing import List, NamedTuple, Optional, Sequence, Tuple
 
 import numpy as np
 
+from utilities.functions import constrain_angle
+
 #: A point in 2D cartesian space.
 Cartesian2D = Tuple[float, float]
 
@@ -21,15 +24,143 @@ class Waypoint(NamedTuple):
         return self._replace(y=-self.y, theta=-self.theta)
 
 
-class Segment(NamedTuple):
-    """A Waypoint with an additional cumulative displacement."""
+#: Layout of a compiled path, as produced by compile_path.
+#: Each row is a waypoint with its cumulative displacement ``s`` along the path,
+#: and the unit vector (``ux``, ``uy``) and ``length`` of the segment that starts
+#: at that waypoint. The segment fields of the final row are zero.
+PATH_DTYPE = np.dtype(
+    [
+        ("x", float),
+        ("y", float),
+        ("theta", float),
+        ("v", float),
+        ("s", float),
+        ("ux", float),
+        ("uy", float),
+        ("length", float),
+    ]
+)
+
+
+def compile_path(waypoints: Sequence[Waypoint]) -> np.ndarray:
+    """Compile a sequence of waypoints into a contiguous array of PATH_DTYPE.
+
+    All the per-segment geometry PurePursuit needs is computed here, once,
+    so following the path does no further hypot work.
+    """
+    path = np.zeros(len(waypoints), dtype=PATH_DTYPE)
+    coords = np.array(waypoints, dtype=float).reshape(-1, 4)
+    path["x"], path["y"], path["theta"], path["v"] = coords.T
+
+    dx = np.diff(path["x"])
+    dy = np.diff(path["y"])
+    lengths = np.hypot(dx, dy)
+    path["length"][:-1] = lengths
+    path["s"][1:] = np.cumsum(lengths)
+    # Leave the unit vector as zero for any degenerate (zero length) segments
+    nonzero = lengths > 0
+    np.divide(dx, lengths, out=path["ux"][:-1], where=nonzero)
+    np.divide(dy, lengths, out=path["uy"][:-1], where=nonzero)
+    return path
+
+
+class VelocityProfile(NamedTuple):
+    """A velocity profile sampled at a uniform spacing along a path."""
+
+    #: Spacing between samples
+    ds: float
+    #: Cumulative displacement of each sample
+    s: np.ndarray
+    #: Speed at each sample
+    v: np.ndarray
+    #: Time at which each sample is reached
+    t: np.ndarray
+
+    def speed_at(self, distance: float) -> float:
+        """Look up the speed at a distance along the path in constant time."""
+        last = len(self.v) - 1
+        index = distance / self.ds if self.ds else 0.0
+        if index <= 0:
+            return self.v.item(0)
+        if index >= last:
+            return self.v.item(last)
+        i = int(index)
+        start = self.v.item(i)
+        return start + (self.v.item(i + 1) - start) * (index - i)
+
+
+class Trajectory(NamedTuple):
+    """A compiled path and its velocity profile, ready to be followed."""
+
+    #: The compiled path, see compile_path
+    path: np.ndarray
+    profile: Optional[VelocityProfile]
+
+
+class PathCache:
+    """A bounded cache of compiled trajectories, evicting the least recently used.
+
+    Trajectories are keyed on their waypoints and motion limits, so fixed legs
+    can be compiled once ahead of time and then stitched onto the robot's
+    current position when they are needed.
+    """
 
-    x: float
-    y: float
-    theta: float
-    v: float
-    #: Cumulative displacement
-    s: float
+    def __init__(self, maxsize: int = 32) -> None:
+        self.maxsize = maxsize
+        self.trajectories: "OrderedDict[tuple, Trajectory]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.trajectories)
+
+    def get(
+        self,
+        waypoints: Sequence[Waypoint],
+        acceleration: float,
+        deceleration: float,
+        jerk: Optional[float] = None,
+    ) -> Trajectory:
+        """Return the compiled trajectory for the waypoints, compiling it if need be."""
+        key = (tuple(waypoints), acceleration, deceleration, jerk)
+        trajectory = self.trajectories.get(key)
+        if trajectory is not None:
+            self.hits += 1
+            self.trajectories.move_to_end(key)
+            return trajectory
+
+        self.misses += 1
+        profile = generate_velocity_profile(waypoints, acceleration, deceleration, jerk)
+        trajectory = Trajectory(compile_path(waypoints), profile)
+        self.put(trajectory, waypoints, acceleration, deceleration, jerk)
+        return trajectory
+
+    def put(
+        self,
+        trajectory: Trajectory,
+        waypoints: Sequence[Waypoint],
+        acceleration: float,
+        deceleration: float,
+        jerk: Optional[float] = None,
+    ) -> None:
+        """Add a trajectory compiled elsewhere, e.g. one loaded from a file."""
+        key = (tuple(waypoints), acceleration, deceleration, jerk)
+        self.trajectories[key] = trajectory
+        self.trajectories.move_to_end(key)
+        while len(self.trajectories) > self.maxsize:
+            self.trajectories.popitem(last=False)
+
+    def stitch(
+        self,
+        prefix: Sequence[Waypoint],
+        waypoints: Sequence[Waypoint],
+        acceleration: float,
+        deceleration: float,
+        jerk: Optional[float] = None,
+    ) -> Trajectory:
+        """Prepend waypoints (e.g. the current position) to a cached trajectory."""
+        trajectory = self.get(waypoints, acceleration, deceleration, jerk)
+        return stitch_trajectory(prefix, trajectory, acceleration, deceleration, jerk)
 
 
 class PurePursuit:
@@ -40,130 +171,160 @@ class PurePursuit:
     https://www.ri.cmu.edu/pub_files/pub3/coulter_r_craig_1992_1/coulter_r_craig_1992_1.pdf
     """
 
-    waypoints: List[Segment]
+    #: The compiled path being followed, see compile_path.
+    waypoints: np.ndarray
 
-    def __init__(self, look_ahead: float, look_ahead_speed_modifier: float):
-        self.waypoints = []
+    def __init__(
+        self,
+        look_ahead: float,
+        look_ahead_speed_modifier: float,
+        *,
+        projection: bool = False,
+        projection_window: int = 2,
+    ):
+        """
+        Args:
+            look_ahead: base lookahead distance, in metres.
+            look_ahead_speed_modifier: additional lookahead per m/s of speed.
+            projection: find the robot's position along the path by projecting
+                it onto the nearest segment, rather than accumulating odometry.
+            projection_window: how many segments either side of the current
+                segment to search when projecting.
+        """
+        self.projection = projection
+        self.projection_window = projection_window
+        self.waypoints = compile_path(())
         self.current_waypoint_number = 0
         self.look_ahead = look_ahead
         self.look_ahead_speed_modifier = look_ahead_speed_modifier
         self.speed_look_ahead = look_ahead
+        #: Feedforward for the rate of change of the heading, in rad/s
+        self.heading_rate = 0.0
         self.completed_path = False
         self.distance_traveled = 0.0
+        self.profile: Optional[VelocityProfile] = None
 
     def find_intersections(
-        self,
-        waypoint_start: Segment,
-        waypoint_end: Segment,
-        robot_position: Cartesian2D,
-    ) -> Optional[np.ndarray]:
+        self, segment: int, robot_position: Cartesian2D
+    ) -> Optional[Cartesian2D]:
         """
         Find the intersection/s between our lookahead distance and path.
 
-        http://mathworld.wolfram.com/Circle-LineIntersection.html
-        NOTE: this will return the intersections in global co-ordinates
+        Solves |p + t*u| = r for the distance t along the segment, where p is
+        the segment start relative to the robot and u is the segment's unit
+        vector. This runs every tick, so it sticks to scalar maths rather than
+        paying NumPy's per-call overhead on 2-vectors.
+        NOTE: this will return the intersections relative to the robot
+
+        Args:
+            segment: index of the segment's starting waypoint in the path.
         """
-        x1, y1 = waypoint_start.x, waypoint_start.y
-        x2, y2 = waypoint_end.x, waypoint_end.y
+        x1, y1, _, _, _, ux, uy, length = self.waypoints.item(segment)
         robot_x, robot_y = robot_position
-        x2 -= robot_x
         x1 -= robot_x
-        y2 -= robot_y
         y1 -= robot_y
-        segment_end = np.array((x2, y2))
+        if length == 0:
+            return None
 
-        dx = x2 - x1
-        dy = y2 - y1
-        dr = math.hypot(dx, dy)
-        D = x1 * y2 - x2 * y1
+        b = x1 * ux + y1 * uy
         r = self.speed_look_ahead
-        delta = r ** 2 * dr ** 2 - D ** 2
-
-        if delta >= 0:  # if an intersection exists
-            sqrt_delta = math.sqrt(delta)
-
-            right_x = self.sgn(dy) * dx * sqrt_delta
-            left_x = D * dy
-            right_y = abs(dy) * sqrt_delta
-            left_y = -D * dx
-            denominator = dr ** 2
-            if denominator == 0:
-                # print("Pursuit: caught division by zero")
-                return None
-            intersection_1 = np.array((left_x + right_x, left_y + right_y))
-            intersection_1 /= denominator
-            if delta == 0:  # if we are tangent to our path
-                return intersection_1
-            intersection_2 = np.array((left_x - right_x, left_y - right_y))
-            intersection_2 /= denominator
-            if np.linalg.norm(intersection_1 - segment_end) < np.linalg.norm(
-                intersection_2 - segment_end
-            ):
-                return intersection_1
-            else:
-                return intersection_2
-        else:
+        delta = b * b - (x1 * x1 + y1 * y1 - r * r)
+        if delta < 0:
             # print(
-            #     f"No intersection start {waypoint_start} end {waypoint_end} robot {robot_position}"
+            #     f"No intersection segment {segment} robot {robot_position}"
             # )
             return None
 
-    def build_path(self, waypoints: Sequence[Waypoint]) -> None:
+        # Of the (up to) two intersections, take the one closest to the segment end
+        sqrt_delta = math.sqrt(delta)
+        t = -b + sqrt_delta
+        if abs(t - length) > abs(-b - sqrt_delta - length):
+            t = -b - sqrt_delta
+        return x1 + t * ux, y1 + t * uy
+
+    def build_path(
+        self,
+        waypoints: Sequence[Waypoint],
+        profile: Optional[VelocityProfile] = None,
+    ) -> None:
         """
         Take in a list of waypoints used to build a path.
 
         The waypoints must be a tuple (x, y, theta, speed), this method will
-        create waypoints with these co-ordinates and distance
-        along the path from the start of the trajectory.
+        compile them into an array holding these co-ordinates, the distance
+        along the path from the start of the trajectory and the geometry of
+        each segment.
+
+        Args:
+            waypoints: the waypoints to follow.
+            profile: a velocity profile for the path, as produced by
+                generate_velocity_profile. If not given, the speed is linearly
+                interpolated between the waypoints.
         """
-        self.last_robot_x = waypoints[0].x
-        self.last_robot_y = waypoints[0].y
+        self.follow(Trajectory(compile_path(waypoints), profile))
+
+    def follow(self, trajectory: Trajectory) -> None:
+        """Start following a precompiled trajectory."""
+        self.last_robot_x, self.last_robot_y = trajectory.path.item(0)[:2]
         self.completed_path = False
         self.distance_traveled = 0
-        self.waypoints = []
-        waypoint_distance = 0.0
-        previous_waypoint = waypoints[0]
-        for waypoint in waypoints:
-            x, y, theta, speed = waypoint
-            # print(waypoint)
-            waypoint_distance += math.hypot(
-                x - previous_waypoint.x, y - previous_waypoint.y
-            )
-            previous_waypoint = waypoint
-            self.waypoints.append(Segment(x, y, theta, speed, waypoint_distance))
+        self.waypoints, self.profile = trajectory
         self.current_waypoint_number = 0
 
-    def compute_direction(
+    def queue_path(
         self,
-        robot_position: Cartesian2D,
-        segment_start: Segment,
-        segment_end: Segment,
-        distance_along_path: float,
-    ) -> np.ndarray:
-        """Find the goal_point and convert it to relative co-ordinates"""
-        goal_point = self.find_intersections(segment_start, segment_end, robot_position)
+        trajectory: Trajectory,
+        acceleration: float,
+        deceleration: float,
+        jerk: Optional[float] = None,
+    ) -> None:
+        """
+        Queue a trajectory to follow on from the current path.
+
+        The trajectory is joined onto the end of the path being followed, so
+        the robot carries its speed into it instead of stopping between them.
+        If no path is being followed, start following the trajectory now.
+        """
+        if (
+            self.completed_path
+            or self.current_waypoint_number >= len(self.waypoints) - 1
+        ):
+            self.follow(trajectory)
+            return
+        current = Trajectory(self.waypoints, self.profile)
+        self.waypoints, self.profile = join_trajectories(
+            current, trajectory, acceleration, deceleration, jerk
+        )
+
+    def compute_direction(
+        self, robot_position: Cartesian2D, segment: int, distance_along_path: float
+    ) -> Cartesian2D:
+        """Find the goal_point and convert it to a relative unit vector"""
+        goal_point = self.find_intersections(segment, robot_position)
         if goal_point is None:
             # if we cant find an intersection between the look_ahead and path
             # use the next waypoint as our goal point
-            goal_point = segment_end[:2]
+            robot_x, robot_y = robot_position
+            end_x, end_y = self.waypoints.item(segment + 1)[:2]
+            goal_point = end_x - robot_x, end_y - robot_y
         # print(goal_point)
-        goal_point /= np.linalg.norm(goal_point)
-        return goal_point
-
-    @staticmethod
-    def sgn(number: float) -> int:
-        """Returns the sign of a number, 0 is positive"""
-        if number < 0:
-            return -1
-        else:
-            return 1
+        goal_x, goal_y = goal_point
+        norm = math.hypot(goal_x, goal_y)
+        if norm == 0:
+            return 0.0, 0.0
+        return goal_x / norm, goal_y / norm
 
     def distance_along_path(self, robot_position: Cartesian2D) -> float:
         """
-        Find the robots position on the path using odometry.
-        Every timestep, add the distance the robot has travelled to a
-        running total used to check for waypoints.
+        Find the robots position on the path.
+
+        In projection mode this is the arc length to the closest point on the
+        path. Otherwise, every timestep, add the distance the robot has
+        travelled to a running total used to check for waypoints.
         """
+        if self.projection:
+            self.distance_traveled = self.project_onto_path(robot_position)
+            return self.distance_traveled
         robot_x, robot_y = robot_position
         self.distance_traveled += math.hypot(
             robot_x - self.last_robot_x, robot_y - self.last_robot_y
@@ -172,6 +333,38 @@ class PurePursuit:
         self.last_robot_y = robot_y
         return self.distance_traveled
 
+    def project_onto_path(self, robot_position: Cartesian2D) -> float:
+        """
+        Find the arc length along the path of the point closest to the robot.
+
+        Only the segments within projection_window of the current segment are
+        searched, so the cost is bounded regardless of the path length. The
+        result never moves backwards along the path.
+        """
+        start = max(self.current_waypoint_number - self.projection_window, 0)
+        end = min(
+            self.current_waypoint_number + self.projection_window + 1,
+            len(self.waypoints) - 1,
+        )
+        segments = self.waypoints[start:end]
+        robot_x, robot_y = robot_position
+        rel_x = robot_x - segments["x"]
+        rel_y = robot_y - segments["y"]
+        along = rel_x * segments["ux"] + rel_y * segments["uy"]
+        np.clip(along, 0, segments["length"], out=along)
+        error_x = rel_x - along * segments["ux"]
+        error_y = rel_y - along * segments["uy"]
+        closest = np.argmin(error_x * error_x + error_y * error_y)
+        distance = segments["s"][closest] + along[closest]
+        return max(distance, self.distance_traveled)
+
+    @property
+    def distance_remaining(self) -> float:
+        """The distance left to travel along the path."""
+        if not len(self.waypoints):
+            return 0.0
+        return self.waypoints["s"][-1] - self.distance_traveled
+
     def find_speed(
         self,
         start_path_distance: float,
@@ -190,25 +383,58 @@ class PurePursuit:
         target_speed = speed_difference * portion_path_completed + start_speed
         return target_speed
 
+    def heading_at(self, distance: float) -> Tuple[float, float]:
+        """
+        Find the desired heading at a distance along the path.
+
+        The heading is interpolated by arc length between the waypoints, so it
+        changes continuously rather than jumping at each segment boundary.
+
+        Returns:
+            The heading, and its rate of change with distance in rad/m.
+        """
+        segment = self.current_waypoint_number
+        last = len(self.waypoints) - 1
+        while segment < last - 1 and self.waypoints.item(segment + 1)[4] <= distance:
+            segment += 1
+        _, _, start_heading, _, start_distance, _, _, length = self.waypoints.item(
+            segment
+        )
+        end_heading = self.waypoints.item(segment + 1)[2]
+        turn = constrain_angle(end_heading - start_heading)
+        if length == 0 or distance >= start_distance + length:
+            return constrain_angle(end_heading), 0.0
+        portion = max(distance - start_distance, 0) / length
+        return constrain_angle(start_heading + turn * portion), turn / length
+
     def find_velocity(self, robot_position: Cartesian2D) -> Tuple[float, float, float]:
-        if self.current_waypoint_number >= len(self.waypoints) - 1:
+        segment = self.current_waypoint_number
+        if segment >= len(self.waypoints) - 1:
             self.completed_path = True
             # print("WARNING: path completed")
             return 0, 0, 0
         distance_along_path = self.distance_along_path(robot_position)
-        segment_start = self.waypoints[self.current_waypoint_number]
-        segment_end = self.waypoints[self.current_waypoint_number + 1]
-        start_speed, start_distance = segment_start[3:]
-        end_speed, end_distance = segment_end[3:]
-        direction = self.compute_direction(
-            robot_position, segment_start, segment_end, distance_along_path
-        )
-        speed = self.find_speed(
-            start_distance, end_distance, start_speed, end_speed, distance_along_path
-        )
-        vx, vy = direction * speed
-        heading = segment_end.theta
+        start_speed, start_distance = self.waypoints.item(segment)[3:5]
+        end_speed, end_distance = self.waypoints.item(segment + 1)[3:5]
+        direction = self.compute_direction(robot_position, segment, distance_along_path)
+        if self.profile is not None:
+            speed = self.profile.speed_at(distance_along_path)
+        else:
+            speed = self.find_speed(
+                start_distance,
+                end_distance,
+                start_speed,
+                end_speed,
+                distance_along_path,
+            )
+        vx = direction[0] * speed
+        vy = direction[1] * speed
         self.speed_look_ahead = self.look_ahead + self.look_ahead_speed_modifier * speed
+        # Lead the heading by the lookahead, as we do the direction
+        heading, heading_per_metre = self.heading_at(
+            distance_along_path + self.speed_look_ahead
+        )
+        self.heading_rate = heading_per_metre * speed
         if self.distance_traveled + self.speed_look_ahead >= end_distance:
             # if we have reached the end of our current segment
             self.current_waypoint_number += 1
@@ -272,3 +498,245 @@ def insert_trapezoidal_waypoints(
     trap_waypoints.append(waypoints[-1])
     # print(f"waypoints = {trap_waypoints}")
     return trap_waypoints
+
+
+def generate_velocity_profile(
+    waypoints: Sequence[Waypoint],
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+    resolution: float = 0.05,
+) -> VelocityProfile:
+    """Generate a time-optimal velocity profile over a whole path.
+
+    The speed between two waypoints may reach the faster of their speeds, and
+    the speed at each waypoint is capped at its own speed. A backward pass then
+    a forward pass over these limits find the fastest profile that respects the
+    acceleration limits across every segment at once.
+
+    Args:
+        acceleration: acceleration when increasing speed
+        deceleration: acceleration when decreasing speed
+        jerk: optional limit on the rate of change of acceleration
+        resolution: maximum spacing between samples along the path
+    """
+    path = compile_path(waypoints)
+    s, ds = _sample_path(path, resolution)
+    limit = _speed_limits(path, s, ds)
+    return _profile_from_limits(s, ds, limit, acceleration, deceleration, jerk)
+
+
+def stitch_trajectory(
+    prefix: Sequence[Waypoint],
+    trajectory: Trajectory,
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+    resolution: float = 0.05,
+) -> Trajectory:
+    """Prepend waypoints to a precompiled trajectory.
+
+    Only the new segments are compiled. The trajectory's existing profile is
+    used as the speed limit over the rest of the path, so just the cheap
+    profile passes are rerun over it. If the prefix adds no length, e.g. the
+    robot is already at the start of the trajectory, it is returned as is.
+    """
+    tail = trajectory.path
+    head = compile_path((*prefix, Waypoint(*tail.item(0)[:4])))
+    offset = head["s"][-1]
+    if offset == 0:
+        return trajectory
+    path = np.concatenate((head[:-1], tail))
+    path["s"][len(head) - 1 :] += offset
+
+    s, ds = _sample_path(path, resolution)
+    in_head = s < offset
+    limit = np.empty_like(s)
+    limit[in_head] = _speed_limits(head, s[in_head], ds)
+    limit[~in_head] = np.interp(
+        s[~in_head] - offset, trajectory.profile.s, trajectory.profile.v
+    )
+    profile = _profile_from_limits(s, ds, limit, acceleration, deceleration, jerk)
+    return Trajectory(path, profile)
+
+
+def join_trajectories(
+    first: Trajectory,
+    second: Trajectory,
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float] = None,
+    resolution: float = 0.05,
+) -> Trajectory:
+    """Join two trajectories, blending the velocity profile across the junction.
+
+    Rather than stopping at the end of the first trajectory, the robot may
+    pass through the junction as fast as the slower of the two legs allows,
+    scaled down by how sharply the path turns there. A straight junction
+    is taken at full speed and a right angle (or sharper) turn is not sped
+    up at all. If the second trajectory does not start where the first ends,
+    a straight segment is added between them.
+
+    Like stitch_trajectory, the existing profiles are reused. Only the
+    blend region, from where the first profile starts slowing down for its
+    end to where the second has finished speeding up from its start, is
+    profiled again. A trajectory without a profile is given one from its
+    waypoint speeds.
+    """
+    first_profile = _profile_or_default(
+        first, acceleration, deceleration, jerk, resolution
+    )
+    second_profile = _profile_or_default(
+        second, acceleration, deceleration, jerk, resolution
+    )
+    head, tail = first.path, second.path
+    end, start = head.item(-1), tail.item(0)
+    end_speed, start_speed = end[3], start[3]
+    first_length = head["s"][-1]
+    if end[:2] == start[:2]:
+        head = head[:-1]
+        offset = first_length
+    else:
+        bridge = compile_path((Waypoint(*end[:4]), Waypoint(*start[:4])))
+        bridge["s"] += first_length
+        head = np.concatenate((head[:-1], bridge[:1]))
+        offset = bridge["s"][-1]
+    path = np.concatenate((head, tail))
+    path["s"][len(head) :] += offset
+
+    junction = len(first.path) - 1
+    if 0 < junction < len(path) - 1:
+        before, at, after = path.tolist()[junction - 1 : junction + 2]
+        turn = before[5] * at[5] + before[6] * at[6]
+        cruise = min(max(before[3], end_speed), max(start_speed, after[3]))
+        path["v"][junction] = max(min(end_speed, start_speed), cruise * max(turn, 0))
+
+    s, ds = _sample_path(path, resolution)
+    in_second = s >= offset
+    v = np.empty_like(s)
+    v[~in_second] = np.interp(s[~in_second], first_profile.s, first_profile.v)
+    v[in_second] = np.interp(s[in_second] - offset, second_profile.s, second_profile.v)
+
+    blend_start = first_profile.s[_final_ramp_start(first_profile.v)]
+    blend_end = offset + second_profile.s[_initial_ramp_end(second_profile.v)]
+    blend = slice(
+        np.searchsorted(s, blend_start, side="right") - 1,
+        np.searchsorted(s, blend_end) + 1,
+    )
+    limit = _speed_limits(path, s, ds)[blend]
+    # Meet the existing profiles at either end of the blend region
+    limit[0] = min(limit[0], v[blend][0])
+    limit[-1] = min(limit[-1], v[blend][-1])
+    v[blend] = _profile_from_limits(
+        s[blend], ds, limit, acceleration, deceleration, jerk
+    ).v
+    return Trajectory(path, VelocityProfile(ds, s, v, _sample_times(v, ds)))
+
+
+def _profile_or_default(
+    trajectory: Trajectory,
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float],
+    resolution: float,
+) -> VelocityProfile:
+    """Return a trajectory's profile, profiling its waypoint speeds if it has none."""
+    if trajectory.profile is not None:
+        return trajectory.profile
+    path = trajectory.path
+    s, ds = _sample_path(path, resolution)
+    limit = _speed_limits(path, s, ds)
+    return _profile_from_limits(s, ds, limit, acceleration, deceleration, jerk)
+
+
+def _final_ramp_start(v: np.ndarray) -> int:
+    """Find the sample a profile starts its final deceleration from."""
+    rising = np.flatnonzero(np.diff(v) >= 0)
+    return rising[-1] + 1 if len(rising) else 0
+
+
+def _initial_ramp_end(v: np.ndarray) -> int:
+    """Find the sample a profile finishes its initial acceleration at."""
+    falling = np.flatnonzero(np.diff(v) <= 0)
+    return falling[0] if len(falling) else len(v) - 1
+
+
+def _sample_path(path: np.ndarray, resolution: float) -> Tuple[np.ndarray, float]:
+    """Evenly space samples along a compiled path, at most resolution apart."""
+    length = path["s"][-1]
+    samples = max(math.ceil(length / resolution), 1) + 1
+    return np.linspace(0, length, samples, retstep=True)
+
+
+def _speed_limits(path: np.ndarray, s: np.ndarray, ds: float) -> np.ndarray:
+    """Find the speed limit at each sample from the waypoint speeds."""
+    segment = np.searchsorted(path["s"], s, side="right") - 1
+    np.clip(segment, 0, max(len(path) - 2, 0), out=segment)
+    segment_end = np.minimum(segment + 1, len(path) - 1)
+    limit = np.maximum(path["v"][segment], path["v"][segment_end])
+    if ds:
+        nearest = np.rint(path["s"] / ds).astype(int)
+        np.clip(nearest, 0, len(s) - 1, out=nearest)
+        np.minimum.at(limit, nearest, path["v"])
+    else:
+        limit[:] = path["v"].min()
+    return limit
+
+
+def _profile_from_limits(
+    s: np.ndarray,
+    ds: float,
+    limit: np.ndarray,
+    acceleration: float,
+    deceleration: float,
+    jerk: Optional[float],
+) -> VelocityProfile:
+    """Run the backward and forward passes over the speed limits."""
+    acceleration = abs(acceleration)
+    deceleration = abs(deceleration)
+    if jerk is None:
+        v_squared = np.square(limit)
+        # Each pass is a running minimum of v^2 = u^2 + 2as from every sample
+        backward = (v_squared + 2 * deceleration * s)[::-1]
+        backward = np.minimum.accumulate(backward)[::-1] - 2 * deceleration * s
+        forward = np.minimum.accumulate(v_squared - 2 * acceleration * s)
+        forward += 2 * acceleration * s
+        v = np.sqrt(np.maximum(np.minimum(forward, backward), 0))
+    else:
+        v = _jerk_limited_pass(limit[::-1], ds, deceleration, jerk)[::-1]
+        v = _jerk_limited_pass(v, ds, acceleration, jerk)
+
+    return VelocityProfile(ds, s, v, _sample_times(v, ds))
+
+
+def _sample_times(v: np.ndarray, ds: float) -> np.ndarray:
+    """Find the time each sample of a profile is reached."""
+    # Time taken for each sample step, assuming constant acceleration
+    step_speed = v[:-1] + v[1:]
+    dt = np.divide(
+        2 * ds, step_speed, out=np.zeros_like(step_speed), where=step_speed > 0
+    )
+    return np.concatenate(((0.0,), np.cumsum(dt)))
+
+
+def _jerk_limited_pass(
+    limit: np.ndarray, ds: float, acceleration: float, jerk: float
+) -> np.ndarray:
+    """Accelerate along the samples as fast as acceleration and jerk allow."""
+    v = np.array(limit, dtype=float)
+    if not ds:
+        return v
+    last_acceleration = 0.0
+    for i in range(len(v) - 1):
+        u = v[i]
+        # Time to cover this step, from standstill under jerk if need be
+        dt = (6 * ds / jerk) ** (1 / 3)
+        if u > 0:
+            dt = min(dt, ds / u)
+        a = min(acceleration, last_acceleration + jerk * dt)
+        reachable = math.sqrt(u * u + 2 * a * ds)
+        if reachable < v[i + 1]:
+            v[i + 1] = reachable
+        # Only ramping the acceleration up is limited by jerk
+        last_acceleration = max((v[i + 1] ** 2 - u * u) / (2 * ds), 0.0)
+    return v
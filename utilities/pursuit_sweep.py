@@ -0,0 +1,191 @@
+"""Headless batch simulation for tuning PurePursuit.
+
+Many simplified holonomic robots are stepped in parallel with NumPy, each
+following the same trajectory with its own lookahead parameters and noise
+seed. This mirrors PurePursuit (in projection mode) closely enough to compare
+tunings without running the full simulator.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from utilities.pure_pursuit import Trajectory
+
+
+class SweepResult(NamedTuple):
+    """Per configuration results of a sweep. Each field has one entry per robot."""
+
+    look_ahead: np.ndarray
+    look_ahead_speed_modifier: np.ndarray
+    seed: np.ndarray
+    #: Time taken to complete the path, NaN if it was not completed
+    completion_time: np.ndarray
+    max_cross_track_error: np.ndarray
+    rms_cross_track_error: np.ndarray
+
+
+def simulate(
+    trajectory: Trajectory,
+    look_ahead: Sequence[float],
+    look_ahead_speed_modifier: Sequence[float],
+    seed: Sequence[int],
+    *,
+    period: float = 1 / 50,
+    timeout: float = 15,
+    noise: float = 0.05,
+    max_acceleration: Optional[float] = None,
+    projection_window: int = 2,
+) -> SweepResult:
+    """Simulate robots following a trajectory, one per configuration.
+
+    Args:
+        trajectory: the trajectory every robot follows.
+        look_ahead: lookahead distance of each robot.
+        look_ahead_speed_modifier: lookahead speed modifier of each robot.
+        seed: noise seed of each robot.
+        period: control loop period, in seconds.
+        timeout: give up on robots that have not finished after this long.
+        noise: standard deviation of the velocity disturbance, in m/s.
+        max_acceleration: if given, limit how fast each robot can change its
+            velocity, in m/s^2. Otherwise robots track commands instantly.
+        projection_window: as for PurePursuit.
+    """
+    look_ahead = np.asarray(look_ahead, dtype=float)
+    modifier = np.asarray(look_ahead_speed_modifier, dtype=float)
+    seed = np.asarray(seed)
+    robots = len(look_ahead)
+    steps = int(np.ceil(timeout / period))
+    path, profile = trajectory
+    segments = len(path) - 1
+    rows = np.arange(robots)
+
+    # Draw each robot's noise up front so it only depends on its seed
+    disturbance = np.empty((steps, robots, 2))
+    for i, robot_seed in enumerate(seed):
+        rng = np.random.RandomState(robot_seed)
+        disturbance[:, i] = rng.normal(scale=noise, size=(steps, 2))
+
+    position = np.repeat(((path["x"][0], path["y"][0]),), robots, axis=0)
+    velocity = np.zeros((robots, 2))
+    segment = np.zeros(robots, dtype=int)
+    distance = np.zeros(robots)
+    speed_look_ahead = look_ahead.copy()
+    completion_time = np.full(robots, np.nan)
+    max_error = np.zeros(robots)
+    sum_squared_error = np.zeros(robots)
+    samples = np.zeros(robots)
+    window = np.arange(-projection_window, projection_window + 1)
+
+    for step in range(steps):
+        active = segment < segments
+        completion_time[~active & np.isnan(completion_time)] = step * period
+        if not active.any():
+            break
+
+        # Project every robot onto the segments around its current segment
+        nearby = path[np.clip(segment[:, None] + window, 0, max(segments - 1, 0))]
+        rel_x = position[:, 0, None] - nearby["x"]
+        rel_y = position[:, 1, None] - nearby["y"]
+        along = np.clip(
+            rel_x * nearby["ux"] + rel_y * nearby["uy"], 0, nearby["length"]
+        )
+        error_squared = (rel_x - along * nearby["ux"]) ** 2 + (
+            rel_y - along * nearby["uy"]
+        ) ** 2
+        closest = np.argmin(error_squared, axis=1)
+        projected = nearby["s"][rows, closest] + along[rows, closest]
+        distance = np.where(active, np.maximum(distance, projected), distance)
+        error = np.sqrt(error_squared[rows, closest])
+        max_error = np.where(active, np.maximum(max_error, error), max_error)
+        sum_squared_error += np.where(active, error ** 2, 0)
+        samples += active
+
+        current = np.minimum(segment, segments - 1)
+        start = path[current]
+        end = path[current + 1]
+        if profile is not None:
+            speed = np.interp(distance, profile.s, profile.v)
+        else:
+            portion = np.divide(
+                distance - start["s"],
+                start["length"],
+                out=np.zeros(robots),
+                where=start["length"] > 0,
+            )
+            speed = start["v"] + (end["v"] - start["v"]) * portion
+
+        # Intersect the lookahead circle with the current segment
+        x1 = start["x"] - position[:, 0]
+        y1 = start["y"] - position[:, 1]
+        b = x1 * start["ux"] + y1 * start["uy"]
+        delta = b * b - (x1 * x1 + y1 * y1 - speed_look_ahead ** 2)
+        intersects = (delta >= 0) & (start["length"] > 0)
+        sqrt_delta = np.sqrt(np.maximum(delta, 0))
+        t = -b + sqrt_delta
+        other = -b - sqrt_delta
+        t = np.where(
+            np.abs(t - start["length"]) > np.abs(other - start["length"]), other, t
+        )
+        goal_x = np.where(intersects, x1 + t * start["ux"], end["x"] - position[:, 0])
+        goal_y = np.where(intersects, y1 + t * start["uy"], end["y"] - position[:, 1])
+        norm = np.hypot(goal_x, goal_y)
+        norm[norm == 0] = np.inf
+        command = np.stack((goal_x / norm * speed, goal_y / norm * speed), axis=1)
+
+        speed_look_ahead = look_ahead + modifier * speed
+        segment += active & (distance + speed_look_ahead >= end["s"])
+
+        # Step the robots
+        if max_acceleration is not None:
+            change = command - velocity
+            change_norm = np.hypot(change[:, 0], change[:, 1])
+            limit = max_acceleration * period
+            scale = np.minimum(1, limit / np.maximum(change_norm, 1e-9))
+            command = velocity + change * scale[:, None]
+        velocity = np.where(active[:, None], command + disturbance[step], 0)
+        position += velocity * period
+
+    rms_error = np.sqrt(sum_squared_error / np.maximum(samples, 1))
+    return SweepResult(
+        look_ahead, modifier, seed, completion_time, max_error, rms_error
+    )
+
+
+def sweep(
+    trajectory: Trajectory,
+    look_aheads: Sequence[float],
+    look_ahead_speed_modifiers: Sequence[float],
+    seeds: Sequence[int] = (0,),
+    *,
+    processes: Optional[int] = None,
+    chunk_size: int = 1024,
+    **kwargs,
+) -> SweepResult:
+    """Simulate every combination of lookahead, speed modifier and seed.
+
+    Args:
+        processes: if more than one, spread the configurations across this
+            many worker processes.
+        chunk_size: maximum number of robots to simulate together.
+        kwargs: passed through to simulate.
+    """
+    grid = np.array(
+        list(itertools.product(look_aheads, look_ahead_speed_modifiers, seeds)),
+        dtype=float,
+    ).reshape(-1, 3)
+    chunks = [
+        (trajectory, chunk[:, 0], chunk[:, 1], chunk[:, 2].astype(int))
+        for chunk in np.array_split(grid, max(int(np.ceil(len(grid) / chunk_size)), 1))
+    ]
+
+    if processes is not None and processes > 1:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(simulate, *chunk, **kwargs) for chunk in chunks]
+            results = [future.result() for future in futures]
+    else:
+        results = [simulate(*chunk, **kwargs) for chunk in chunks]
+
+    return SweepResult(*map(np.concatenate, zip(*results)))
@@ -0,0 +1,77 @@
+import math
+from typing import List, Sequence
+
+import numpy as np
+
+from utilities.functions import constrain_angle
+from utilities.pure_pursuit import Waypoint
+
+
+def hermite_path(
+    waypoints: Sequence[Waypoint],
+    lateral_acceleration: float,
+    resolution: float = 0.05,
+    tangent_scale: float = 1.0,
+) -> List[Waypoint]:
+    """Fit a cubic Hermite spline through waypoints and sample it for PurePursuit.
+
+    The spline leaves each waypoint in the direction of its theta, so the
+    robot is expected to be facing along the path at every waypoint. The
+    heading of each sample is interpolated between the waypoints, and its
+    speed is capped so that the lateral acceleration around the curve stays
+    within the limit.
+
+    Args:
+        waypoints: the waypoints to pass through.
+        lateral_acceleration: maximum acceleration towards the centre of
+            curvature, in m/s^2.
+        resolution: maximum spacing between samples, in metres.
+        tangent_scale: length of the tangents relative to the distance between
+            the waypoints. Larger values give wider, flatter corners.
+    """
+    path = []
+    for start, end in zip(waypoints, waypoints[1:]):
+        chord = math.hypot(end.x - start.x, end.y - start.y)
+        if chord == 0:
+            continue
+        samples = max(math.ceil(chord / resolution), 1)
+        u = np.arange(samples) / samples
+        u2 = u * u
+        u3 = u2 * u
+
+        tangent = chord * tangent_scale
+        m0 = tangent * math.cos(start.theta), tangent * math.sin(start.theta)
+        m1 = tangent * math.cos(end.theta), tangent * math.sin(end.theta)
+
+        points = []
+        velocities = []
+        accelerations = []
+        for p0, p1, t0, t1 in zip(start[:2], end[:2], m0, m1):
+            points.append(
+                (2 * u3 - 3 * u2 + 1) * p0
+                + (u3 - 2 * u2 + u) * t0
+                + (-2 * u3 + 3 * u2) * p1
+                + (u3 - u2) * t1
+            )
+            velocities.append(
+                (6 * u2 - 6 * u) * (p0 - p1)
+                + (3 * u2 - 4 * u + 1) * t0
+                + (3 * u2 - 2 * u) * t1
+            )
+            accelerations.append(
+                (12 * u - 6) * (p0 - p1) + (6 * u - 4) * t0 + (6 * u - 2) * t1
+            )
+        (x, y), (dx, dy), (ddx, ddy) = points, velocities, accelerations
+
+        # Curvature of a parametric curve: |x'y'' - y'x''| / |p'|^3
+        curvature = np.abs(dx * ddy - dy * ddx)
+        curvature /= np.maximum(np.hypot(dx, dy), 1e-9) ** 3
+        speed_limit = np.sqrt(lateral_acceleration / np.maximum(curvature, 1e-9))
+        speed = np.minimum(start.v + (end.v - start.v) * u, speed_limit)
+        theta = start.theta + constrain_angle(end.theta - start.theta) * u
+
+        for sample in zip(x.tolist(), y.tolist(), theta.tolist(), speed.tolist()):
+            path.append(Waypoint(*sample))
+
+    path.append(waypoints[-1])
+    return path